@@ -47,6 +47,19 @@ class Checker:
 
         return img
 
+    def drawTile(self, char: str, w: int, h: int) -> np.ndarray:
+        """
+        Draw a character and shrink it to a `h * w` tile of ink density (uint8, 255 for full ink)
+
+        Params
+        ------
+            - `char`: the character to be drawn
+            - `w`: tile width
+            - `h`: tile height
+        """
+        img = self.drawChr(char).convert("L").resize((w, h), Image.BOX)
+        return 255 - np.asarray(img, dtype=np.uint8)
+
 
     def cntPxl(self, img: Image, countingAlgo: str) -> float | None:
         """
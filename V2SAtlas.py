@@ -0,0 +1,149 @@
+import numpy as np
+from typing import Tuple
+from functools import cache
+from ChrDensityChecker import Checker
+
+SHAPE_GRID = (2, 3)  # sub-pixels (w, h) of a cell compared by the shape matcher
+SHAPE_LEVELS = 4  # quantization levels of a sub-pixel in the patch lookup cache
+
+class GlyphAtlas:
+    """
+    Pre-rasterized glyph tiles of a pixel set, used to compose char pictures as images.
+
+    Every glyph is drawn once; a frame is then composed by gathering the tiles with
+    the cell-index array, so the cost does not depend on any font layout.
+
+    Params
+    ------
+    - `pixelSet`: the chrs to be rasterized (str)
+    - `font`: the font of the chrs (str)
+    - `tileSize`: size of one cell on the image, as `(w, h)` (tuple)
+    """
+    def __init__(self, pixelSet: str, font: str = "Consolas", tileSize: Tuple[int, int] = (6, 11)) -> None:
+        self.chars = np.unique(np.array(list(pixelSet)))
+        self.codes = np.array([ord(c) for c in self.chars], dtype=np.uint32)
+        self.tileSize = tileSize
+        checker = Checker(font, list(self.chars))
+        self.fontFilePath = checker.fontFilePath
+        # (n, h, w), white glyphs on black, same look as the monitor
+        self.tiles = np.stack([checker.drawTile(c, *tileSize) for c in self.chars])
+
+    def lookup(self, chars: np.ndarray) -> np.ndarray:
+        """
+        Map an array of chrs (or their code points) to the tile indices of the atlas
+
+        Param
+        -----
+            - `chars`: array of chrs (`str`) or code points (`uint32`)
+        """
+        if chars.dtype.kind == "U":
+            chars = chars.view(np.uint32).reshape(chars.shape)
+        idx = np.searchsorted(self.codes, chars)
+        return np.minimum(idx, len(self.codes) - 1)
+
+    def toIdx(self, frame: str) -> np.ndarray:
+        """
+        Convert a char picture to its 2-D array of tile indices
+
+        Param
+        -----
+            - `frame`: char picture whose rows are joined by `\\n`
+        """
+        rows = frame.count("\n") + 1
+        codes = np.frombuffer((frame + "\n").encode("utf-32-le"), dtype=np.uint32)
+        return self.lookup(codes.reshape(rows, -1)[:, :-1])
+
+    def compose(self, idx: np.ndarray) -> np.ndarray:
+        """
+        Compose a grey image (uint8) by gathering the tiles with the cell-index array
+
+        Param
+        -----
+            - `idx`: 2-D array of tile indices
+        """
+        rows, cols = idx.shape
+        w, h = self.tileSize
+        return self.tiles[idx].transpose(0, 2, 1, 3).reshape(rows * h, cols * w)
+
+    def rasterize(self, frame: str) -> np.ndarray:
+        """
+        Rasterize a char picture to a grey image (uint8)
+
+        Param
+        -----
+            - `frame`: char picture whose rows are joined by `\\n`
+        """
+        return self.compose(self.toIdx(frame))
+
+
+class ShapeMatcher:
+    """
+    Pick glyphs by the structure of the cells rather than their mean brightness.
+
+    Every cell is split into a small patch of sub-pixels, which is matched against the
+    rasterized bitmaps of the glyphs (nearest neighbour). Patches are quantized, so the
+    match of a patch is searched only once and kept in a lookup cache.
+
+    Params
+    ------
+    - `pixelSet`: the chrs to be matched (str)
+    - `font`: the font of the chrs (str)
+    - `grid`: sub-pixels of a cell, as `(w, h)` (tuple)
+    - `levels`: quantization levels of a sub-pixel (int)
+    """
+    def __init__(self, pixelSet: str, font: str = "Consolas", grid: Tuple[int, int] = SHAPE_GRID, levels: int = SHAPE_LEVELS) -> None:
+        self.grid = grid
+        self.levels = levels
+        checker = Checker(font, list(pixelSet))
+        glyphs = np.stack([checker.drawTile(c, *grid).ravel() for c in pixelSet]).astype(float)
+        self.glyphs = glyphs / glyphs.max()  # (n, d) glyph matrix
+        self.glyphNorms = (self.glyphs ** 2).sum(axis=1)
+        self.weights = levels ** np.arange(grid[0] * grid[1])
+        self.cache = np.full(levels ** (grid[0] * grid[1]), -1, dtype=np.intp)
+
+    def match(self, img: np.ndarray) -> np.ndarray:
+        """
+        Match every cell of a grey image to the index of its closest glyph
+
+        Param
+        -----
+            - `img`: grey image (in [0, 1]) of `(rows * h, cols * w)` sub-pixels
+        """
+        w, h = self.grid
+        rows, cols = img.shape[0] // h, img.shape[1] // w
+        patches = img.reshape(rows, h, cols, w).transpose(0, 2, 1, 3).reshape(rows, cols, -1)
+        codes = np.rint(patches * (self.levels - 1)).astype(np.intp) @ self.weights
+
+        miss = np.unique(codes[self.cache[codes] < 0])
+        if miss.size:  # batched nearest-neighbour search of the unseen patches
+            centers = (miss[:, None] // self.weights) % self.levels / (self.levels - 1)
+            dist = self.glyphNorms - 2 * centers @ self.glyphs.T
+            self.cache[miss] = dist.argmin(axis=1)
+        return self.cache[codes]
+
+
+@cache
+def getShapeMatcher(pixelSet: str, font: str) -> ShapeMatcher:
+    """
+    Build (once) the shape matcher of a pixel set
+
+    Params
+    ------
+        - `pixelSet`: the chrs to be matched
+        - `font`: the font of the chrs
+    """
+    return ShapeMatcher(pixelSet, font)
+
+
+@cache
+def getAtlas(pixelSet: str, font: str, tileSize: Tuple[int, int]) -> GlyphAtlas:
+    """
+    Build (once) the glyph atlas of a pixel set at a given tile size
+
+    Params
+    ------
+        - `pixelSet`: the chrs to be rasterized
+        - `font`: the font of the chrs
+        - `tileSize`: size of one cell on the image, as `(w, h)`
+    """
+    return GlyphAtlas(pixelSet, font, tileSize)
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+from time import perf_counter
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from V2SConverter import V2SConverter
+
+VIDEO_EXTS = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".webm", ".wmv"}
+JOURNAL = "journal.jsonl"
+
+
+def convertOne(video: str, lrc: str | None, outPath: str, reso: tuple, pixelMode: int) -> Tuple[int, float]:
+    """
+    Convert one video (and its lyrics) to a processed file, return the number of frames and the seconds taken
+
+    Params
+    ------
+        - `video`: path of the raw video
+        - `lrc`: path of the lyrics file, or `None`
+        - `outPath`: path of the processed file
+        - `reso`: resolution of the converter
+        - `pixelMode`: pixel set of the converter
+    """
+    start = perf_counter()
+    converter = V2SConverter(reso, 1, pixelMode)
+    converter.loadRawVideo(video, audioPath=None)
+    if lrc:
+        converter.loadLrc(lrc)
+    converter.saveProcessed(outPath + ".part")
+    os.replace(outPath + ".part", outPath)  # never leave a half-written file behind
+    return len(converter.imgBook), perf_counter() - start
+
+
+class V2SBatch:
+    """
+    Convert a batch of videos to processed files with a process pool, without Tk or pygame.
+
+    Finished videos are recorded in a journal in the output directory, with the settings & the size and mtime
+    of their sources, so an interrupted run resumes without converting them again (unless they changed).
+
+    Params
+    ------
+    - `jobs`: list of `(video, lyrics or None)` (list)
+    - `outDir`: directory of the processed files & the journal (str)
+    - `workers`: number of converting processes, `None` for all the cores (int)
+    - `reso`: resolution of the converter (tuple)
+    - `pixelMode`: pixel set of the converter (int)
+    """
+    def __init__(self, jobs: List[Tuple[str, str | None]], outDir: str, workers: int | None = None,
+                 reso: tuple = (200, 80), pixelMode: int = 2) -> None:
+        unique = {}
+        for v, l in jobs:  # a video listed twice is converted once
+            unique.setdefault(os.path.abspath(v), l and os.path.abspath(l))
+        self.jobs = list(unique.items())
+        self.outDir = outDir
+        self.workers = workers
+        self.reso = reso
+        self.pixelMode = pixelMode
+        self.journalPath = os.path.join(outDir, JOURNAL)
+
+    @staticmethod
+    def scan(path: str) -> List[Tuple[str, str | None]]:
+        """
+        List the jobs of a directory (videos with the `.lrc` of the same name if any),
+        or of a manifest file (one `video[,lyrics]` per line, relative to the manifest)
+
+        Param
+        -----
+            - `path`: the directory or the manifest
+        """
+        jobs = []
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                stem, ext = os.path.splitext(name)
+                if ext.lower() in VIDEO_EXTS:
+                    lrc = os.path.join(path, stem + ".lrc")
+                    jobs.append((os.path.join(path, name), lrc if os.path.exists(lrc) else None))
+        else:
+            root = os.path.dirname(path)
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not (line := line.strip()) or line.startswith("#"):
+                        continue
+                    video, _, lrc = map(str.strip, line.partition(","))
+                    jobs.append((os.path.join(root, video), os.path.join(root, lrc) if lrc else None))
+        return jobs
+
+    def outPath(self, video: str) -> str:
+        """
+        Path of the processed file of a video, unique to its full path (`a.mp4` & `a.mkv` do not collide)
+        """
+        digest = hashlib.sha1(os.path.abspath(video).encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.outDir, f"{os.path.basename(video)}.{digest}.v2s")
+
+    def fingerprint(self, video: str, lrc: str | None) -> dict:
+        """
+        The settings of the batch and the size & mtime of the sources a processed file depends on
+
+        Params
+        ------
+            - `video`: path of the raw video
+            - `lrc`: path of the lyrics file, or `None`
+        """
+        def stat(path: str | None) -> list | None:
+            return [os.path.getsize(path), os.path.getmtime(path)] if path and os.path.exists(path) else None
+
+        return {"reso": list(self.reso), "pixelMode": self.pixelMode, "lrc": lrc, "videoStat": stat(video), "lrcStat": stat(lrc)}
+
+    def readJournal(self) -> dict:
+        """
+        Return the fingerprints of the videos already converted (journaled as done and with the processed file present),
+        the latest of every video
+        """
+        done = {}
+        if os.path.exists(self.journalPath):
+            with open(self.journalPath, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:  # line cut by an interruption
+                        continue
+                    if entry["status"] == "done" and os.path.exists(entry["output"]):
+                        done[entry["video"]] = entry.get("fingerprint")
+        return done
+
+    def run(self) -> None:
+        """
+        Convert the videos not converted yet, printing the timing of every file and the overall throughput
+        """
+        os.makedirs(self.outDir, exist_ok=True)
+        done = self.readJournal()
+        # a video converted with other settings, or edited since, is converted again
+        todo = [(v, l) for v, l in self.jobs if v not in done or done[v] != self.fingerprint(v, l)]
+        print(f"{len(self.jobs)} videos, {len(self.jobs) - len(todo)} already done, {len(todo)} to convert")
+
+        start = perf_counter()
+        totalFrames = 0
+        with ProcessPoolExecutor(self.workers) as pool, open(self.journalPath, "a", encoding="utf-8") as journal:
+            futures = {  # the sources are fingerprinted before they are read
+                pool.submit(convertOne, v, l, self.outPath(v), self.reso, self.pixelMode): (v, self.fingerprint(v, l))
+                for v, l in todo
+            }
+            for i, future in enumerate(as_completed(futures), 1):
+                video, fingerprint = futures[future]
+                entry = {"video": video, "output": self.outPath(video), "fingerprint": fingerprint}
+                try:
+                    frames, sec = future.result()
+                    totalFrames += frames
+                    entry |= {"status": "done", "frames": frames, "sec": round(sec, 3)}
+                    print(f"[{i}/{len(todo)}] {os.path.basename(video)}: {frames} frames in {sec:.1f}s ({frames / sec:.0f} fps)")
+                except Exception as e:
+                    entry |= {"status": "failed", "error": str(e)}
+                    print(f"[{i}/{len(todo)}] {os.path.basename(video)}: failed ({e})")
+                journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                journal.flush()
+
+        elapsed = perf_counter() - start
+        print(f"Converted {len(todo)} videos, {totalFrames} frames in {elapsed:.1f}s ({totalFrames / max(elapsed, 1e-9):.0f} fps)")
+
+
+if __name__ == "__main__":
+    """
+    python V2SBatch.py <directory or manifest> <output directory>
+    """
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Convert a batch of videos to processed files")
+    parser.add_argument("source", help="directory of videos (with matching .lrc), or a manifest of `video[,lyrics]` lines")
+    parser.add_argument("outDir")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--reso", default="200x80", help="chrs per row & rows, as WxH")
+    parser.add_argument("--pixel", type=int, default=2, help="pixel mode of the converter")
+    args = parser.parse_args()
+
+    V2SBatch(
+        V2SBatch.scan(args.source),
+        args.outDir,
+        args.workers,
+        tuple(map(int, args.reso.split("x"))),
+        args.pixel,
+    ).run()
@@ -0,0 +1,167 @@
+import numpy as np
+import tracemalloc
+from time import perf_counter
+from typing import List, Tuple
+from V2SEngine import V2SEngine, VirtualClock
+from V2SConverter import V2SConverter
+
+# (time in seconds, action, argument)
+DEFAULT_SCRIPT = [
+    (0.0, "play", None),
+    (3.0, "seek", 0.5),
+    (5.0, "pause", None),
+    (5.5, "seek", 0.2),
+    (6.0, "play", None),
+    (7.0, "reso", (120, 48)),
+    (9.0, "seek", 0.9),
+]
+
+# fraction of the memory budget allowed for the working buffers not charged to it (a decoded frame, a batch of rendered frames)
+BUDGET_SLACK = 0.1
+
+
+def syntheticConverter(frames: int = 600, fps: float = 30, size: Tuple[int, int] = (320, 240), reso: tuple = (200, 80)) -> V2SConverter:
+    """
+    Build a converter holding a synthetic video (a moving gradient) & lyrics switching every second
+
+    Params
+    ------
+        - `frames`: number of frames
+        - `fps`: frames per second
+        - `size`: size of the frames, as `(w, h)`
+        - `reso`: resolution of the converter
+    """
+    converter = V2SConverter(reso, 1, 0)
+    x = np.linspace(0, 1, size[0])[None, :].repeat(size[1], axis=0)
+    converter.loadFrames([(x + i / frames) % 1 for i in range(frames)], fps)
+    converter.lrcList = [[float(t), "\n".join(f"line {t}")] for t in range(int(frames / fps))] + [[np.inf, ""]]
+    return converter
+
+
+def runSession(engine: V2SEngine, script: List[tuple], duration: float) -> dict:
+    """
+    Run a scripted session on an engine with a `VirtualClock`, presenting a frame every tick
+
+    Return the trace of the engine, the ticks of the seeks & their target frames and the render time of every frame.
+
+    Params
+    ------
+        - `engine`: engine built with a `VirtualClock`
+        - `script`: list of `(time, action, argument)`, where action is one of `["play", "pause", "seek", "reso"]`
+        - `duration`: virtual seconds to run
+    """
+    clock = engine.player
+    engine.trace = []
+    script = sorted(script, key=lambda x: x[0])
+    seeks, renderSec = [], []
+    while clock.time() < duration:
+        while script and script[0][0] <= clock.time():
+            _, action, arg = script.pop(0)
+            match action:
+                case "play" if engine.getCurState() == "onPause":
+                    engine.switch(None)
+                case "pause" if engine.getCurState() == "onPlay":
+                    engine.switch(None)
+                case "seek":
+                    engine.setPerc(arg)
+                    seeks.append((len(engine.trace), round(arg * (len(engine.converter.imgBook) - 1))))
+                case "reso":
+                    engine.setBaseReso(arg)
+                case _:
+                    ...
+        engine.step()
+        t = perf_counter()
+        engine.getCurInfo()
+        renderSec.append(perf_counter() - t)
+        clock.sleep(1 / engine.converter.fps)
+    return {"trace": engine.trace, "seeks": seeks, "renderSec": renderSec}
+
+
+def report(session: dict) -> dict:
+    """
+    Summarize the pacing, lyrics switches & render time of a session, and the render time of the first frame after every seek
+
+    Param
+    -----
+        - `session`: the result of `runSession`
+    """
+    trace = session["trace"]
+    idx = np.array([x[1] for x in trace])
+    steps = np.diff(idx)
+    forward = steps[(steps >= 0) & (steps <= 2)]  # consecutive ticks while playing or paused
+    renderMs = np.array(session["renderSec"]) * 1000
+    return {
+        "ticks": len(trace),
+        "repeated": int((forward == 0).sum()),
+        "advanced": int((forward == 1).sum()),
+        "skipped": int((forward == 2).sum()),
+        "seekRenderMs": [float(renderMs[tick]) for tick, _ in session["seeks"]],
+        "lrcSwitches": int((np.diff([x[2] for x in trace]) != 0).sum()),
+        "renderMsMean": float(renderMs.mean()),
+        "renderMsMax": float(renderMs.max()),
+    }
+
+
+def budgetCheck(filePath: str, budget: int, reso: tuple = (200, 80), played: int = 100, slack: float = BUDGET_SLACK) -> dict:
+    """
+    Load a video under a memory budget, prerender it (or fall back to rendering when played), play some frames,
+    and assert that the peak of the memory traced by `tracemalloc` stays within the budget (and `slack` of it)
+
+    Return the peaks & whether the video was prerendered.
+    Raise `MemoryError` if the frames of the video do not fit in the budget.
+
+    Params
+    ------
+        - `filePath`: path of the raw video
+        - `budget`: memory budget in bytes
+        - `reso`: resolution of the converter
+        - `played`: number of frames rendered when played, evenly spread over the video
+        - `slack`: fraction of the budget allowed over it
+    """
+    converter = V2SConverter(reso, 0, memBudget=budget)  # the pixel set & the modules it loads are not charged
+    tracemalloc.start()
+    try:
+        converter.loadRawVideo(filePath, audioPath=None)
+        loadPeak = tracemalloc.get_traced_memory()[1]
+        engine = V2SEngine(converter, 0, clock=VirtualClock(), buffer=False)
+        try:
+            engine.bufferImages()
+        except MemoryError:
+            ...
+        for perc in np.linspace(0, 1, played):
+            engine.setPerc(perc)
+            engine.getCurInfo()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak <= budget * (1 + slack), \
+        f"Peak of {peak / 2**20:.1f} MB over the budget of {budget / 2**20:.1f} MB (and {slack:.0%} of slack)"
+    return {
+        "loadPeakMB": loadPeak / 2**20,
+        "peakMB": peak / 2**20,
+        "prerendered": len(engine.bufferedImgs) == len(converter.imgBook),
+        "reportedMB": sum(engine.memoryReport().values()) / 2**20,
+    }
+
+
+if __name__ == "__main__":
+    """
+    python V2SBench.py [processed video]
+    python V2SBench.py --budget MB raw video
+    """
+    import sys
+    if len(sys.argv) > 3 and sys.argv[1] == "--budget":
+        for k, v in budgetCheck(sys.argv[3], int(float(sys.argv[2]) * 2**20)).items():
+            print(f"{k}: {v}")
+        sys.exit()
+    if len(sys.argv) > 1:
+        converter = V2SConverter((200, 80), 1)
+        converter.loadProcessed(sys.argv[1], audioPath=None)
+    else:
+        converter = syntheticConverter()
+    engine = V2SEngine(converter, 1, clock=VirtualClock())
+    start = perf_counter()
+    result = report(runSession(engine, DEFAULT_SCRIPT, 12.0))
+    print(f"12.0 virtual seconds in {perf_counter() - start:.2f}s")
+    for k, v in result.items():
+        print(f"{k}: {v}")
@@ -0,0 +1,140 @@
+import os
+import shutil
+import hashlib
+from typing import Callable
+from V2SConverter import V2SConverter
+
+PROCESSED = "processed"
+AUDIO = "audio.mp3"
+
+
+class ProcessedCache:
+    """
+    Processed videos cached on disk, keyed by the hash of the source video and the conversion settings.
+
+    Every entry is a directory holding the processed video and its music, so a video seen before
+    is loaded without decoding. Least recently used entries are evicted past the quota.
+
+    Params
+    ------
+    - `root`: directory of the cache (str)
+    - `quota`: max bytes of the cache on disk (int)
+    """
+    def __init__(self, root: str = ".v2s_cache", quota: int = 2**31) -> None:
+        self.root = root
+        self.quota = quota
+
+    @staticmethod
+    def key(videoPath: str, settings: tuple) -> str:
+        """
+        Hash the content of a video together with the conversion settings
+
+        Params
+        ------
+            - `videoPath`: path of the raw video
+            - `settings`: anything changing the processed state (reso, pixel mode, ...)
+        """
+        h = hashlib.sha256()
+        with open(videoPath, "rb") as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        h.update(repr(settings).encode("utf-8"))
+        return h.hexdigest()[:32]
+
+    def get(self, key: str) -> str | None:
+        """
+        Return the entry directory of `key` if cached (and mark it as recently used)
+
+        Param
+        -----
+            - `key`: key of the entry
+        """
+        entry = os.path.join(self.root, key)
+        if not os.path.exists(os.path.join(entry, PROCESSED)):
+            return None
+        os.utime(entry)
+        return entry
+
+    def put(self, key: str, converter: V2SConverter, audioPath: str, progress: Callable[[float], None] | None = None) -> str:
+        """
+        Cache the state of a converter and its music, return the entry directory
+
+        Params
+        ------
+            - `key`: key of the entry
+            - `converter`: converter with the video loaded
+            - `audioPath`: path of the extracted music
+            - `progress`: called with the fraction of the processed video written
+        """
+        entry = os.path.join(self.root, key)
+        tmp = entry + ".part"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            # the music first: it may be removed by the monitor while the frames are written
+            shutil.copyfile(audioPath, os.path.join(tmp, AUDIO))
+            converter.saveProcessed(os.path.join(tmp, PROCESSED), progress)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        self.evict(keep=entry)
+        return entry
+
+    def load(self, entry: str, converter: V2SConverter, audioPath: str, progress: Callable[[float], None] | None = None) -> None:
+        """
+        Load a cached entry into a converter, copying its music to `audioPath`
+
+        The stored frames do not depend on the render settings,
+        so the ones of the converter are kept rather than those saved in the entry.
+
+        Params
+        ------
+            - `entry`: the entry directory
+            - `converter`: converter to be loaded
+            - `audioPath`: where the music is copied to
+            - `progress`: called with the fraction of the processed video read
+        """
+        reso, pixelMode, pixelSet, font = converter.reso, converter.pixelMode, converter.pixelSet, converter.font
+        converter.loadProcessed(os.path.join(entry, PROCESSED), audioPath=None, progress=progress)
+        converter.setVideoAttr(reso=reso, font=font)
+        converter.pixelMode, converter.pixelSet = pixelMode, pixelSet
+        converter.currentVideoInfo = (converter.reso, converter.pixelMode, converter.font)
+        shutil.copyfile(os.path.join(entry, AUDIO), audioPath)
+
+    def entries(self) -> list:
+        """
+        Return the entry directories, most recently used first
+        """
+        if not os.path.isdir(self.root):
+            return []
+        ans = [
+            os.path.join(self.root, x) for x in os.listdir(self.root)
+            if not x.endswith(".part") and os.path.exists(os.path.join(self.root, x, PROCESSED))
+        ]
+        return sorted(ans, key=os.path.getmtime, reverse=True)
+
+    def latest(self) -> str | None:
+        """
+        Return the most recently used entry directory, if any
+        """
+        return next(iter(self.entries()), None)
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        Remove the least recently used entries until the cache fits in the quota
+
+        Param
+        -----
+            - `keep`: an entry never to be removed
+        """
+        entries = self.entries()
+        sizes = {e: sum(os.path.getsize(os.path.join(e, x)) for x in os.listdir(e)) for e in entries}
+        total = sum(sizes.values())
+        for e in reversed(entries):
+            if total <= self.quota:
+                break
+            if e != keep:
+                shutil.rmtree(e, ignore_errors=True)
+                total -= sizes[e]
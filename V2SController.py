@@ -1,9 +1,16 @@
 import os
 from threading import Thread
+from PIL import Image, ImageTk
 from V2SUI import V2SUI
+from V2SAtlas import getAtlas
+from V2SJobs import JobExecutor
+from V2SCache import ProcessedCache
 from V2SEngine import V2SEngine
+from V2SFrameStore import DeltaFrameStore
 from V2SConverter import V2SConverter
 
+JOB_POLL_MS = 50
+
 
 class V2SController:
     """
@@ -20,13 +27,18 @@ class V2SController:
     def __init__(self, ui: V2SUI) -> None:
         self.ui = ui
         self.engine = None
-        self.converter = V2SConverter(self.ui.monitorSize, self.ui.dynamicReso.get())
+        self.converter = V2SConverter(self.ui.monitorSize, self.ui.dynamicReso.get(), memBudget=self.memBudget(), bands=os.cpu_count())
+        self.cache = ProcessedCache(quota=self.ui.cacheQuota.get() * 2**20)
+        self.jobs = JobExecutor()
+        self.bufferJob = self.loadJob = self.cacheJob = None
+        self.scrubbing = False  # whether the progress bar is held
 
     def run(self) -> None:
         """
         Activate the controller.
         """
         self.bindMainUICommand()
+        self.pollJobs()
         self.ui.root.mainloop()
 
     def bindMainUICommand(self) -> None:
@@ -34,13 +46,17 @@ class V2SController:
         Bind functions and commands to the ui
         """
         self.ui.systmenu.add_command(command=self.initConfig, label="Config")
+        self.ui.systmenu.add_command(command=self.exportVideo, label="Export Video")
         self.ui.systmenu.add_command(command=self.ui.root.destroy, label="Exit")
         self.ui.root.protocol("WM_DELETE_WINDOW", self.destroyMain)
 
         # Vars (Config)
         self.ui.pixelSet.trace_add("write", self.onChangePixelSet)
+        self.ui.dither.trace_add("write", self.onChangeDither)
         self.ui.resolution.trace_add("write", self.onChangeResolution)
         self.ui.fontScale.trace_add("write", self.onChangeFontScale)
+        self.ui.memBudget.trace_add("write", self.onChangeMemBudget)
+        self.ui.cacheQuota.trace_add("write", self.onChangeCacheQuota)
 
         # Console
         widgetCommandPairs = [
@@ -48,6 +64,7 @@ class V2SController:
             [self.ui.rawVideoBt, self.loadRawVideo],
             [self.ui.videoBt, self.loadProcessedVideo],
             [self.ui.monitorBt, self.initMonitor],
+            [self.ui.cancelBt, self.jobs.cancel],
         ]
         for ele, com in widgetCommandPairs:
             ele["command"] = com
@@ -74,6 +91,7 @@ class V2SController:
             self.engine.destroy()
         if self.ui.monitorWin:
             self.destroyMonitor()
+        self.jobs.shutdown()
         self.ui.root.destroy()
 
     def onChangePixelSet(self, *args) -> None:
@@ -81,10 +99,14 @@ class V2SController:
         The callback function called when the `self.ui.pixelSet` is changed.
         """
         self.converter.setVideoAttr(pixelMode=self.ui.pixelSet.get())
-        if self.engine and not self.engine.strategy:
-            self.engine.switch(None)
-            self.engine.bufferedImgs = self.engine.bufferImages()
-            self.engine.switch(None)
+        self.rebuffer()
+
+    def onChangeDither(self, *args) -> None:
+        """
+        The callback function called when the `self.ui.dither` is changed.
+        """
+        self.converter.setVideoAttr(dither=bool(self.ui.dither.get()))
+        self.rebuffer()
 
     def onChangeResolution(self, *args) -> None:
         """
@@ -98,24 +120,35 @@ class V2SController:
             return
         if self.engine.getCurState() == "onPlay":
             self.handlePlayBtn()
-            self.converter.setVideoAttr(reso=self.ui.monitorSize)
+            self.engine.setBaseReso(self.ui.monitorSize)
             self.handlePlayBtn()
         else:
-            self.converter.setVideoAttr(reso=self.ui.monitorSize)
+            self.engine.setBaseReso(self.ui.monitorSize)
         if self.ui.monitorWin:
-            self.ui.videoPane.config(font=[
-                self.ui.font,
-                self.resoToFontSize(self.ui.resolution.get(), self.ui.fontScale.get()),
-                "bold",
-            ])
+            self.ui.videoPane.config(font=[self.ui.font, self.monitorFontSize(), "bold"])
 
     def onChangeFontScale(self, *args) -> None:
         if self.ui.monitorWin:
-            self.ui.videoPane.config(font=[
-                self.ui.font,
-                self.resoToFontSize(self.ui.resolution.get(), self.ui.fontScale.get()),
-                "bold",
-            ])
+            self.ui.videoPane.config(font=[self.ui.font, self.monitorFontSize(), "bold"])
+
+    def onChangeMemBudget(self, *args) -> None:
+        """
+        The callback function called when the `self.ui.memBudget` is changed.
+        """
+        self.converter.setVideoAttr(memBudget=self.memBudget())
+
+    def onChangeCacheQuota(self, *args) -> None:
+        """
+        The callback function called when the `self.ui.cacheQuota` is changed.
+        """
+        self.cache.quota = self.ui.cacheQuota.get() * 2**20
+        self.cache.evict()
+
+    def memBudget(self) -> int | None:
+        """
+        The memory budget of the converter in bytes (`None` for unlimited).
+        """
+        return self.ui.memBudget.get() * 2**20 or None
 
     def resoToFontSize(self, reso: float, scale: float) -> int:
         """
@@ -123,6 +156,22 @@ class V2SController:
         """
         return max(int((11 - 4 * reso) * scale), 1)
 
+    def monitorFontSize(self) -> int:
+        """
+        The font size of the monitor, following the resolution actually played by the engine.
+        """
+        reso = self.ui.resolution.get()
+        if self.engine and self.engine.governor:
+            reso *= self.engine.governor.scale()
+        return self.resoToFontSize(reso, self.ui.fontScale.get())
+
+    def fontSizeToTile(self, fontSize: int) -> tuple:
+        """
+        Map the font size in the screen to the size (w, h) of one glyph tile in the raster display.
+        """
+        h = max(round(fontSize * 1.6), 2)
+        return max(round(h * 4 / 7), 1), h
+
     def loadLrc(self) -> None:
         """
         Load lrc file to the converter.
@@ -142,34 +191,57 @@ class V2SController:
 
     def loadRawVideo(self) -> None:
         """
-        Load video & lyrics file to the converter.
+        Load video & lyrics file to the converter in the background.
 
-        If beffer is allowed, then buffer the video file.
+        If beffer is allowed, then a video seen before is loaded from the cache without decoding,
+        and a new one is added to the cache.
 
         If completed, lauch monitor.
         """
+        if self.isBusy():
+            return
         self.updateStatus("Loading New Video...")
         path = self.ui.askLoadPath("Choose Video File")
         if not path:
             self.updateStatus("Video Loading Cancelled")
             return
 
-        try:
-            self.destroyMonitor()
-            self.converter.loadRawVideo(path)
+        self.destroyMonitor()
+        allowBuffer, settings = self.ui.allowBuffer.get(), self.cacheSettings()
+
+        def load(report) -> str | None:
+            if not allowBuffer:
+                self.converter.loadRawVideo(path, progress=report)
+                return None
+            if entry := self.cache.get(key := self.cache.key(path, settings)):
+                self.cache.load(entry, self.converter, "buffer.mp3", report)
+                return None
+            self.converter.loadRawVideo(path, progress=report)
+            return key
+
+        def onDone(key: str | None) -> None:
             self.loadLrc()
-            if self.ui.allowBuffer.get():
-                self.saveProcessedVideo("buffer")
-            self.updateStatus("Video Loading Completed")
+            if key:
+                self.cacheJob = self.jobs.submit("Video Caching", lambda report: self.cache.put(key, self.converter, "buffer.mp3", report))
             self.initMonitor()
-        except Exception as e:
-            self.updateStatus("Video Loading Failed")
-            print(e)
+
+        self.loadJob = self.jobs.submit("Video Loading", load, onDone)
+
+    def cacheSettings(self) -> tuple:
+        """
+        The converter settings the cached processed videos depend on.
+
+        Only the memory budget changes the stored frames (their precision),
+        the render settings are applied to the frames after loading.
+        """
+        return (self.converter.memBudget,)
 
     def loadProcessedVideo(self, filePath: str | None = None) -> None:
         """
         The procedure to load processed video (state of the converter).
         """
+        if self.isBusy():
+            return
         self.updateStatus("Loading Processed Video...")
         if not filePath:
             filePath = self.ui.askLoadPath("Choose Video File")
@@ -177,12 +249,7 @@ class V2SController:
                 self.updateStatus("Video Loading Cancelled")
                 return
 
-        try:
-            self.converter.loadProcessed(filePath)
-            self.updateStatus("Video Loading Completed")
-        except Exception as e:
-            self.updateStatus("Video Loading Failed")
-            print(e)
+        self.loadJob = self.jobs.submit("Video Loading", lambda report: self.converter.loadProcessed(filePath, progress=report))
 
     def saveProcessedVideo(self, filePath: str | None = None) -> None:
         """
@@ -195,12 +262,24 @@ class V2SController:
                 self.updateStatus("Video Saving Cancelled")
                 return
 
-        try:
-            self.converter.saveProcessed(filePath)
-            self.updateStatus("Video Saving Completed")
-        except Exception as e:
-            self.updateStatus("Video Saving Failed")
-            print(e)
+        self.jobs.submit("Video Saving", lambda report: self.converter.saveProcessed(filePath, report))
+
+    def exportVideo(self, filePath: str | None = None) -> None:
+        """
+        The procedure to export the converted video as an mp4 file.
+        """
+        self.updateStatus("Exporting Video...")
+        if not self.converter.imgBook:
+            self.updateStatus("No Video To Export")
+            return
+        if not filePath:
+            filePath = self.ui.askSavePath("Export Video")
+            if not filePath:
+                self.updateStatus("Video Exporting Cancelled")
+                return
+
+        tileSize = self.fontSizeToTile(self.resoToFontSize(self.ui.resolution.get(), self.ui.fontScale.get()))
+        self.jobs.submit("Video Exporting", lambda report: self.converter.exportVideo(filePath, tileSize=tileSize, progress=report))
 
     def bindMonitorCommand(self) -> None:
         """
@@ -214,6 +293,8 @@ class V2SController:
         ]
         for ele, com in widgetCommandPairs:
             ele["command"] = com
+        self.ui.processBar.bind("<ButtonPress-1>", self.handleProcessPress)
+        self.ui.processBar.bind("<ButtonRelease-1>", self.handleProcessRelease)
 
     def handlePlayBtn(self) -> None:
         """
@@ -227,61 +308,135 @@ class V2SController:
         """
         Callback function when the progrss bar is dragged.
         
-        Change the engine progress.
+        Change the engine progress. While the bar is held, only the thumbnails are shown and
+        the music is sought once on release.
         """
+        if self.scrubbing:
+            self.engine.drag(self.ui.process.get())
+        else:
+            self.engine.setPerc(self.ui.process.get())
+
+    def handleProcessPress(self, event=None) -> None:
+        """
+        Callback function when the progrss bar is pressed.
+        """
+        self.scrubbing = True
+
+    def handleProcessRelease(self, event=None) -> None:
+        """
+        Callback function when the progrss bar is released.
+
+        Seek the engine (and the music) to the final position.
+        """
+        self.scrubbing = False
         self.engine.setPerc(self.ui.process.get())
 
     def checkLoaded(self) -> int:
         """
         Check whether the converter has loaded a video before lauching the monitor.
+
+        If not, start loading one in the background, which launches the monitor once completed.
         """
         if self.converter.imgBook:
             return 1
-        if os.path.exists("buffer"):
-            self.loadProcessedVideo("buffer")
-            return 1
-        if not self.ui.okCancel("Load Video",
-                                "No buffer file found\nLoad a new video?"):
+        if entry := self.cache.latest():
+            self.updateStatus("Loading Buffered Video...")
+            self.loadJob = self.jobs.submit(
+                "Video Loading",
+                lambda report: self.cache.load(entry, self.converter, "buffer.mp3", report),
+                lambda _: self.initMonitor(),
+            )
             return 0
-        try:
+        if self.ui.okCancel("Load Video", "No buffered video found\nLoad a new video?"):
             self.loadRawVideo()
-            return 1
-        except:
-            return 0
+        return 0
 
     def initMonitor(self) -> None:
         """
         Procedures before lauching the monitor
+
+        Prerendering (strategy `0`) runs in the background: the monitor opens at once,
+        and the frames not buffered yet are rendered when played.
         """
-        if not self.checkLoaded() or self.engine:  # Loaded and no multi window
+        if self.engine or self.isBusy(caching=False) or not self.checkLoaded():  # Loaded and no multi window
             return
 
-        self.updateStatus("Rendering...")
-        self.engine = V2SEngine(self.converter, self.ui.dynamicReso.get())
-        self.updateStatus("Render Completed")
+        self.engine = V2SEngine(self.converter, self.ui.dynamicReso.get(), self.ui.adaptiveReso.get(), buffer=False)
         if self.ui.strategyCheck:
             self.ui.strategyCheck["state"] = "disabled"
         self.ui.showMonitor(processReso=1 / len(self.converter.imgBook))
-        self.ui.videoPane.config(font=[
-            self.ui.font,
-            self.resoToFontSize(self.ui.resolution.get(), self.ui.fontScale.get()),
-            "bold",
-        ])
+        self.ui.videoPane.config(font=[self.ui.font, self.monitorFontSize(), "bold"])
         self.bindMonitorCommand()
+        self.rebuffer()
         Thread(target=self.engine.loop, daemon=True).start()
         Thread(target=self.updateScreen, daemon=True).start()
 
+    def rebuffer(self) -> None:
+        """
+        (Re)start prerendering the frames of the engine in the background, if it plays prerendered frames.
+
+        If the frames do not fit in the memory budget, they are all rendered when played instead.
+        """
+        if self.bufferJob:
+            self.bufferJob.cancel()
+            self.bufferJob = None
+        if not self.engine or self.engine.strategy:
+            return
+        self.engine.bufferedImgs = DeltaFrameStore()
+        engine = self.engine
+        self.bufferJob = self.jobs.submit("Rendering", lambda report: engine.bufferImages(report))
+
+    def isBusy(self, caching: bool = True) -> bool:
+        """
+        Whether a video is being loaded into the converter, or being cached.
+
+        Param
+        -----
+            - `caching`: whether a video being cached counts
+        """
+        if self.loadJob in self.jobs.pending or caching and self.cacheJob in self.jobs.pending:
+            self.updateStatus("Busy, Wait Or Cancel")
+            return True
+        return False
+
+    def pollJobs(self) -> None:
+        """
+        Show the progress of the background jobs in the console, and run their callbacks.
+
+        Called by the main thread every `JOB_POLL_MS` ms.
+        """
+        for kind, job, value in self.jobs.poll():
+            match kind:
+                case "progress":
+                    self.updateStatus(f"{job.label}... {value:.0%}")
+                case "done":
+                    self.updateStatus(f"{job.label} Completed")
+                    if job.onDone:
+                        job.onDone(value)
+                case "cancelled":
+                    self.updateStatus(f"{job.label} Cancelled")
+                case "failed" if isinstance(value, MemoryError):  # refused by the memory budget
+                    self.updateStatus(f"{job.label} Refused: {value}")
+                case "failed":
+                    self.updateStatus(f"{job.label} Failed")
+                    print(value)
+        self.ui.root.after(JOB_POLL_MS, self.pollJobs)
+
     def destroyMonitor(self) -> None:
         """
         Procedures to destroy the monitor
         """
+        if self.bufferJob:
+            self.bufferJob.cancel()
+            self.bufferJob = None
+        self.scrubbing = False
         if self.engine:
             self.engine.destroy()
         if self.ui.monitorWin:
             self.ui.monitorWin.destroy()
         if self.ui.strategyCheck:
             self.ui.strategyCheck["state"] = "normal"
-        if os.path.exists("buffer.mp3"):
+        if os.path.exists("buffer.mp3") and self.cacheJob not in self.jobs.pending:  # still to be cached
             os.remove("buffer.mp3")
         self.ui.monitorWin = self.engine = None
 
@@ -293,6 +448,7 @@ class V2SController:
         It should never be called by the main thread.
         """
         prev = -1
+        level = 0
         n = len(self.converter.imgBook) - 1
         while self.ui.monitorWin and self.engine and self.engine.state != "destroyed":
             match self.engine.state:  # This should actually be laze updated
@@ -302,15 +458,38 @@ class V2SController:
                     self.ui.playBt.config(text="┃┃")
                 case _: ...
             
-            if (now := int(self.engine.getPerc() * n)) != prev:
+            if (now := (int(self.engine.getPerc() * n), self.ui.rasterDisplay.get(), "Drag" in self.engine.state)) != prev:
                 frame, lrc = self.engine.getCurInfo()
-                self.ui.videoPane.config(text=frame)
+                if now[1]:
+                    self.showRaster(frame)
+                else:
+                    self.ui.videoPane.config(text=frame, image="")
                 self.ui.lrcPane.config(text=lrc)
                 prev = now
+            if self.engine.governor and self.engine.governor.level != level:
+                level = self.engine.governor.level
+                self.ui.videoPane.config(font=[self.ui.font, self.monitorFontSize(), "bold"])
             self.ui.process.set(self.engine.getPerc())
             if self.ui.monitorWin:
                 self.ui.monitorWin.update()
 
+    def showRaster(self, frame: str) -> None:
+        """
+        Show a frame on the monitor as one image composed from the glyph atlas.
+
+        Param
+        -----
+            - `frame`: the char picture to be shown
+        """
+        atlas = getAtlas(
+            "".join(self.converter.pixelSet),
+            self.converter.font,
+            self.fontSizeToTile(self.monitorFontSize()),
+        )
+        photo = ImageTk.PhotoImage(Image.fromarray(atlas.rasterize(frame)))
+        self.ui.videoPane.config(image=photo, text="")
+        self.ui.videoPane.image = photo  # keep the reference, or Tk shows nothing
+
     def updateStatus(self, message: str) -> None:
         """
         Update the status indicator in the console.
@@ -1,11 +1,30 @@
+import os
 import re
+import sys
 import cv2
 import numpy as np
-from typing import Any
+from math import gcd
+from typing import Any, Callable, List
 from functools import cache
+from bisect import bisect_left
+from collections import deque
+from V2SFrameStore import LEVEL_TOLERANCE, PackedFrame, findLevels, quantError
 
 # PxlToChrConsolas = [(0.0, ' '), (0.0338256817950028, '`'), (0.06038400256465478, '_'), (0.1031548341232787, "'"), (0.14023629970635199, '"'), (0.19635218230015475, '.'), (0.22601551259737007, '^'), (0.25891135929878006, ','), (0.2735762462995739, '-'), (0.3445939809589873, ':'), (0.3774437364649546, '~'), (0.41085416064945796, '*'), (0.4323972714254259, ';'), (0.45845451342385996, '='), (0.46881434969863267, 'r'), (0.47530120492049516, 'L'), (0.479260689294568, '!'), (0.481913796090146, '/'), (0.4923376277517668, '\\'), (0.5121580280119277, '['), (0.5139450800354002, '<'), (0.5200041366478282, '>'), (0.5248836437583435, 'C'), (0.5383723147703382, 'c'), (0.5402922301421171, '?'), (0.5440060762685631, '('), (0.5636446958916976, ')'), (0.5761369690804913, 'J'), (0.5819986427359428, 'F'), (0.5877564331006455, 'U'), (0.5882627238464987, ']'), (0.590060670274725, '|'), (0.6023798259281136, '7'), (0.6095596251074707, '{'), (0.6105722133199729, 'j'), (0.6106637337127919, 'n'), (0.6157497203730258, 'u'), (0.6160997258084664, 'T'), (0.6276263555208564, '+'), (0.6312958074519822, 'v'), (0.6324782200115308, '}'), (0.6463269910894083, 'O'), (0.6490122232734695, 'h'), (0.6537678325729626, 'o'), (0.6569075617149418, 'P'), (0.6608656649661401, 'H'), (0.6646286098427036, 'D'), (0.6725079763206332, 'Y'), (0.673600780552851, 't'), (0.6781875164974477, 'f'), (0.6806166461598506, 'l'), (0.6810801153758481, 'i'), (0.6817768296979745, '3'), (0.6930214683957272, '5'), (0.6996269556876324, 's'), (0.7059324805655696, '2'), (0.7149349788521866, 'y'), (0.7157369710295225, 'E'), (0.7162526070374449, 'I'), (0.7176051934252519, 'z'), (0.7207869476831692, 'G'), (0.7210831262909205, 'b'), (0.72134874209446, 'p'), (0.7229038965307116, 'Z'), (0.7242675755866551, 'M'), (0.7252316766411642, 'x'), (0.7268772727830275, 'd'), (0.7269886161535278, '1'), (0.7298606359650802, 'Q'), (0.7323440662710492, '%'), (0.7327817881307134, 'q'), (0.7333136078071439, 'w'), (0.7418663069698506, 'S'), (0.742039989051831, 'V'), (0.7531816551262294, 'e'), (0.7613307740555255, 'k'), (0.7718015370116589, 'm'), (0.7723422012511125, 'a'), (0.7800802429028889, '9'), (0.7832353727410407, '6'), (0.796812687646632, 'K'), (0.800469743075864, 'W'), (0.8075584284703562, 'R'), (0.8076400793792844, 'X'), (0.8151893675717421, 'A'), (0.8233377203306864, '4'), (0.8356712013534359, 'N'), (0.8378120325373746, 'g'), (0.8564806536105232, '0'), (0.8614395736060404, '8'), (0.8630910638829851, 'B'), (0.8651030238694034, '#'), (0.9436950480696324, '&'), (0.9642596887365757, '$'), (1.0, '@')]
 DEFAULT_PIXEL_KWARGS = {'SetLen': 70}
+EXPORT_CHUNK = 16  # frames per export task
+PACK_SAMPLE = 64  # leading frames the grey levels of a video are detected on
+MAX_REFITS = 8  # times the grey levels are fitted again before giving up packing a video
+PREVIEW_WIDTH = 96  # pixels per row of the thumbnails shown while scrubbing
+BAND_MIN_CELLS = 40000  # frames of fewer cells are rendered serially, threads would cost more than they save
+
+# Sub-cell pixel modes: sub-pixels (w, h) of a cell, and the bit of every sub-pixel (row-major) in its pattern
+SUBCELL_GRIDS = {4: (2, 4), 5: (2, 2)}
+SUBCELL_BITS = {
+    4: np.array([0, 3, 1, 4, 2, 5, 6, 7]),  # Braille dots 1 4 / 2 5 / 3 6 / 7 8
+    5: np.array([0, 1, 2, 3]),  # quadrants UL UR / LL LR
+}
+BAYER_4 = (np.array([[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]]) + 0.5) / 16
 
 class PixelFactory:
     """
@@ -38,10 +57,59 @@ class PixelFactory:
                     i = i1 if abs(pxls[i1][0] - w) <= abs(pxls[i2][0] - w) else i2
                     ans += pxls[i][1]
                 return ans
+            case 3:
+                # glyphs picked by shape, see `V2SAtlas.ShapeMatcher`
+                return "".join(map(chr, range(32, 127)))
+            case 4:
+                # Braille, indexed by the pattern of the 2*4 dots
+                return "".join(map(chr, range(0x2800, 0x2900)))
+            case 5:
+                # quadrant blocks, indexed by the pattern of the 2*2 quadrants
+                return " ▘▝▀▖▌▞▛▗▚▐▜▄▙▟█"
             case _:
                 return " "
             
 
+class ProgressFile:
+    """
+    File wrapper reporting the fraction of `total` bytes read or written so far
+
+    Params
+    ------
+    - `f`: the binary file
+    - `total`: expected number of bytes (int)
+    - `progress`: called with the fraction (callable)
+    """
+    def __init__(self, f, total: int, progress: Callable[[float], None]) -> None:
+        self.f = f
+        self.total = max(total, 1)
+        self.progress = progress
+        self.done = 0
+
+    def __count(self, n: int) -> None:
+        self.done += n
+        self.progress(min(self.done / self.total, 1))
+
+    def write(self, b: bytes) -> int:
+        self.__count(len(b))
+        return self.f.write(b)
+
+    def read(self, n: int = -1) -> bytes:
+        b = self.f.read(n)
+        self.__count(len(b))
+        return b
+
+    def readinto(self, b) -> int:
+        n = self.f.readinto(b)
+        self.__count(n)
+        return n
+
+    def readline(self) -> bytes:
+        b = self.f.readline()
+        self.__count(len(b))
+        return b
+
+
 class V2SConverter:
     """
     Load original video file (image & music) and convert it into char pictures.
@@ -53,57 +121,166 @@ class V2SConverter:
     Params
     ------
     - reso: resolution (tuple)
-    - pixelMode: the pixel set to choose (int, start from 0)
-    - pixelArgs: args used in pixel factory (PxlSet, SetLen, Font)
+    - pixelMode: the pixel set to choose (int, start from 0; `3` picks glyphs by cell shape;
+                `4` / `5` threshold 2*4 / 2*2 sub-pixels to Braille / quadrant blocks)
+    - pixelArgs: args used in pixel factory (PxlSet, SetLen, Font, Dither)
     - font: the font of the chrs (str)
+    - memBudget: max bytes of the loaded & rendered frames, `None` for unlimited (int)
+    - bands: max number of horizontal bands a large frame is rendered in on a thread pool, `1` for serial (int)
+
+    Frames are kept as float (8 bytes per pixel) by default, and as uint8 if that does not
+    fit in `memBudget`; rendered frames cached by `getFrame` are evicted (oldest first) to
+    stay within the budget. Videos of only a few grey levels (e.g. black & white) are kept
+    as `PackedFrame` of 1, 2 or 4 bits per pixel instead.
+
+    A thumbnail of every frame (`previewBook`, `PREVIEW_WIDTH` pixels wide) is kept to be
+    rendered instantly while the progress is dragged.
+
+    Bands are only cut at output rows starting at a whole input row, so a banded frame is
+    identical to a serial one; frames which cannot be cut this way are rendered serially.
 
     TODO: None
     """
-    def __init__(self, reso: tuple, strategy: int, pixelMode: int = 2, pixelArgs: dict = DEFAULT_PIXEL_KWARGS, font: str = "Consolas") -> None:
+    def __init__(self, reso: tuple, strategy: int, pixelMode: int = 2, pixelArgs: dict = DEFAULT_PIXEL_KWARGS, font: str = "Consolas",
+                 memBudget: int | None = None, bands: int = 1) -> None:
         self.font = font
+        self.memBudget = memBudget
+        self.bands = bands
+        self.__pool = None  # thread pool of the bands
         self.reso = reso
         self.strategy = strategy  # 0: average
         self.pixelMode = pixelMode
         self.pixelSet = np.array(list(PixelFactory.getPxls(self.pixelMode, **pixelArgs)))
+        self.dither = pixelArgs.get("Dither", False)  # ordered dithering of the sub-cell modes
         
         # (resolution, pixelMode, font)
         # if info is changed, the mismatched picture will be lazily and dynamically re-rendered
         self.currentVideoInfo = (self.reso, self.pixelMode, self.font)
 
         self.vDir = self.lDir = ""
-        self.imgBook = self.fps = self.renderedImgs = self.imgInfoList = None
-        self.lrcList = [[np.Inf, '\n'.join("No Lyrics")]]
+        self.imgBook = self.fps = self.renderedImgs = self.imgInfoList = self.previewBook = None
+        self.lrcList = [[np.inf, '\n'.join("No Lyrics")]]
+        self.__imgBookBytes = self.__previewBytes = self.__renderedBytes = 0
+        self.__rendered = deque()  # indices of the cached rendered frames, oldest first
 
-    def loadRawVideo(self, filePath: str) -> bool:
+    def loadRawVideo(self, filePath: str, audioPath: str | None = "buffer.mp3", progress: Callable[[float], None] | None = None) -> bool:
         """
         Load the raw video into the class (imgBook & fps & music)
 
-        Param
-        -----
+        Params
+        ------
             - `filePath`: path of file to be loaded
+            - `audioPath`: where the music is extracted to (`None` to skip the music)
+            - `progress`: called with the fraction of frames decoded
         """
         # Video
-        imgs = []
-        cap = cv2.VideoCapture(filePath)
-
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            imgs.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) / 255)
-        self.imgBook = imgs
-        self.imgInfoList = [None] * len(self.imgBook)
-        self.renderedImgs = [None] * len(self.imgBook)
-        self.fps = cap.get(5)
-        cap.release()
+        # the grey levels are detected on the leading frames, then every frame is packed as decoded;
+        # if a later frame does not fit the levels, the video is decoded again without packing
+        video = self.__decodeVideo(filePath, True, progress) or self.__decodeVideo(filePath, False, progress)
+        self.imgBook, self.previewBook, self.fps = video
+        self.__initRendered()
 
         # Music
-        from moviepy.editor import VideoFileClip
-        VideoFileClip(filePath).audio.write_audiofile("buffer.mp3")
+        if audioPath:
+            from moviepy.editor import VideoFileClip
+            VideoFileClip(filePath).audio.write_audiofile(audioPath)
 
         self.vDir = filePath
         return True
     
+    def loadFrames(self, imgs: List[np.ndarray], fps: float) -> bool:
+        """
+        Load frames decoded (or generated) elsewhere into the class, charging them to the memory budget like a loaded video
+
+        Params
+        ------
+            - `imgs`: 1-channel grey frames, as float in `[0, 1]` or uint8
+            - `fps`: frames per second
+        """
+        self.imgBook, self.fps = list(imgs), fps
+        self.previewBook = [makePreview(x) for x in self.imgBook]
+        self.__initRendered()
+        return True
+
+    def __decodeVideo(self, filePath: str, pack: bool, progress: Callable[[float], None] | None) -> tuple | None:
+        """
+        Decode the grey frames, their thumbnails & the fps of a video, charging the stored frames & thumbnails to the memory budget
+
+        The grey levels are detected on the leading frames (more of them while they hold a single level, e.g. a black intro),
+        and fitted again on all the frames so far when a later frame does not fit them.
+        Return `None` if `pack` and a frame does not fit the levels even fitted again.
+
+        Params
+        ------
+            - `filePath`: path of file to be loaded
+            - `pack`: whether to try packing the frames to few grey levels
+            - `progress`: called with the fraction of frames decoded
+        """
+        imgs, previews = [], []
+        cap = cv2.VideoCapture(filePath)
+        try:
+            count = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1)
+            w, h = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            previewPixels = count * PREVIEW_WIDTH * max(round(h * PREVIEW_WIDTH / max(w, 1)), 1)
+            asFloat = self.memBudget is None or int(count * w * h) * 8 + previewPixels <= self.memBudget
+            levels = None
+            decided = not pack  # whether the levels are detected yet
+            hist = np.zeros((256, 1), dtype=np.float32)
+            frameHist = np.zeros((256, 1), dtype=np.float32)
+
+            def store(frame: np.ndarray) -> np.ndarray | PackedFrame:
+                return PackedFrame(frame, levels) if levels is not None else frame / 255 if asFloat else frame
+
+            nbytes = previewBytes = refits = 0
+            while cap.isOpened():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                previews.append(makePreview(frame))
+                previewBytes += previews[-1].nbytes
+                if decided:
+                    if levels is not None:
+                        frameHist = cv2.calcHist([frame], [0], None, [256], [0, 256], frameHist)
+                        hist += frameHist
+                        if quantError(frameHist, levels) > 2 * LEVEL_TOLERANCE or quantError(hist, levels) > LEVEL_TOLERANCE:
+                            levels = findLevels(hist) if refits < MAX_REFITS else None
+                            if levels is None or quantError(frameHist, levels) > 2 * LEVEL_TOLERANCE:
+                                return None
+                            refits += 1
+                            for i, x in enumerate(imgs):  # in place, a single frame is repacked at a time
+                                imgs[i] = PackedFrame(x.unpack(), levels)
+                            nbytes = sum(x.nbytes for x in imgs)
+                    imgs.append(store(frame))
+                    nbytes += imgs[-1].nbytes
+                else:
+                    imgs.append(frame)
+                    hist = cv2.calcHist([frame], [0], None, [256], [0, 256], hist, accumulate=True)
+                    nbytes += frame.nbytes
+                    # the raw sample takes at most half of the budget, and grows while it holds a single level
+                    full = self.memBudget is not None and 2 * nbytes >= self.memBudget
+                    if full or len(imgs) % PACK_SAMPLE == 0:
+                        levels = findLevels(hist)
+                        if full or levels is None or len(levels) > 1:
+                            decided = True
+                            for i, x in enumerate(imgs):
+                                imgs[i] = store(x)
+                            nbytes = sum(x.nbytes for x in imgs)
+                        else:
+                            levels = None
+                if self.memBudget is not None and nbytes + previewBytes > self.memBudget:
+                    raise MemoryError(f"The video exceeds the memory budget of {self.memBudget / 2**20:.0f} MB")
+                if progress:
+                    progress(min(len(imgs) / count, 1))
+            fps = cap.get(5)
+        finally:
+            cap.release()
+        if not decided:  # shorter than the sample
+            levels = findLevels(hist)
+            for i, x in enumerate(imgs):
+                imgs[i] = store(x)
+        return imgs, previews, fps
+
     def loadLrc(self, filePath: str) -> None:
         """
         Load lyrics file
@@ -128,27 +305,188 @@ class V2SConverter:
 
             if not lrc:
                 raise Exception("Parsed Empty Lyrics")
-            self.lrcList = lrc + [[np.Inf, '\n'.join("No Lyrics")]]
+            self.lrcList = lrc + [[np.inf, '\n'.join("No Lyrics")]]
             self.lDir = filePath
         except Exception as e:
             raise e
 
-    def render(self, originalImg: np.ndarray[Any, np.ndarray[Any, float]], pxlSet: np.ndarray[Any, str]) -> str:
+    def renderIdx(self, originalImg: np.ndarray[Any, np.ndarray[Any, float]], setLen: int,
+                  reso: tuple | None = None, rowOffset: int = 0) -> np.ndarray[Any, np.ndarray[Any, int]]:
         """
-        Resize & Convert a grey image to an ascii string image
+        Resize a grey image & map every cell to an index of the pixel set
 
         Params
         ------
             - `originalImg`: a 1-channel grey picture, stored as `numpy.ndarray`
-            - `pxlSet`: the set of pixels to replace the pixels in `originalImg`
+            - `setLen`: the length of the pixel set
+            - `reso`: resolution of the cells, `self.reso` by default
+            - `rowOffset`: row of the first cell in the whole frame (for a band of the frame)
         """
+        reso = reso or self.reso
+        if isinstance(originalImg, PackedFrame):
+            originalImg = originalImg.unpack()
+        if self.pixelMode == 3:
+            from V2SAtlas import getShapeMatcher
+            matcher = getShapeMatcher("".join(self.pixelSet), self.font)
+            originalImg = cv2.resize(
+                originalImg,
+                (reso[0] * matcher.grid[0], reso[1] * matcher.grid[1]),
+                interpolation=cv2.INTER_AREA,
+            )
+            return matcher.match(originalImg / 255 if originalImg.dtype == np.uint8 else originalImg)
+        if self.pixelMode in SUBCELL_GRIDS:
+            return self.renderSubcellIdx(originalImg, reso, rowOffset)
+
         originalImg = cv2.resize(
             originalImg,
-            self.reso,
+            reso,
             interpolation=cv2.INTER_AREA,
         )
-        frame = pxlSet[(originalImg * (len(pxlSet) - 1)).astype(np.int)]
-        return "\n".join(map(''.join, frame))
+        if originalImg.dtype == np.uint8:
+            originalImg = originalImg / 255
+        return (originalImg * (setLen - 1)).astype(int)
+
+    def gridSize(self, reso: tuple | None = None) -> tuple:
+        """
+        Return the size `(w, h)` a frame is resized to when rendered: a pixel per cell, or per sub-cell of the sub-cell & shape modes
+
+        Param
+        -----
+            - `reso`: resolution of the cells, `self.reso` by default
+        """
+        reso = reso or self.reso
+        if self.pixelMode == 3:
+            from V2SAtlas import getShapeMatcher
+            grid = getShapeMatcher("".join(self.pixelSet), self.font).grid
+        else:
+            grid = SUBCELL_GRIDS.get(self.pixelMode, (1, 1))
+        return reso[0] * grid[0], reso[1] * grid[1]
+
+    def renderSubcellIdx(self, originalImg: np.ndarray[Any, np.ndarray[Any, float]],
+                         reso: tuple | None = None, rowOffset: int = 0) -> np.ndarray[Any, np.ndarray[Any, int]]:
+        """
+        Resize a grey image to the sub-pixels of the cells, threshold (or dither) them, and pack
+        the pattern of every cell into its index of the pixel set (Braille / quadrant blocks)
+
+        Params
+        ------
+            - `originalImg`: a 1-channel grey picture, stored as `numpy.ndarray`
+            - `reso`: resolution of the cells, `self.reso` by default
+            - `rowOffset`: row of the first cell in the whole frame, which sets the phase of the dithering
+        """
+        (w, h), (cols, rows) = SUBCELL_GRIDS[self.pixelMode], reso or self.reso
+        img = cv2.resize(originalImg, (cols * w, rows * h), interpolation=cv2.INTER_AREA)
+        if img.dtype == np.uint8:
+            img = img / 255
+        if self.dither:
+            threshold = BAYER_4[np.ix_((np.arange(rows * h) + rowOffset * h) % 4, np.arange(cols * w) % 4)]
+        else:
+            threshold = 0.5
+        patches = (img > threshold).reshape(rows, h, cols, w).transpose(0, 2, 1, 3).reshape(rows, cols, h * w)
+        order = np.argsort(SUBCELL_BITS[self.pixelMode])  # sub-pixel of every bit
+        return np.packbits(patches[..., order], axis=-1, bitorder="little")[..., 0]
+
+    def render(self, originalImg: np.ndarray[Any, np.ndarray[Any, float]], pxlSet: np.ndarray[Any, str]) -> str:
+        """
+        Resize & Convert a grey image to an ascii string image
+
+        Params
+        ------
+            - `originalImg`: a 1-channel grey picture, stored as `numpy.ndarray`
+            - `pxlSet`: the set of pixels to replace the pixels in `originalImg`
+        """
+        # one copy of the settings, which may be changed by the ui thread meanwhile
+        return self.__render(originalImg, pxlSet, tuple(self.reso), self.bands)
+
+    def __render(self, originalImg: np.ndarray[Any, np.ndarray[Any, float]], pxlSet: np.ndarray[Any, str], reso: tuple, bands: int) -> str:
+        """
+        `render` at a given resolution, cut into at most `bands` bands
+        """
+        cols, rows = reso
+        if isinstance(originalImg, PackedFrame):
+            originalImg = originalImg.unpack()
+        codes = np.frombuffer("".join(pxlSet).encode("utf-32-le"), dtype=np.uint32)
+        out = np.empty((rows, cols + 1), dtype=np.uint32)  # code points, with a column of `\n`
+        out[:, cols] = ord("\n")
+        bounds = self.bandBounds(originalImg.shape, reso, bands)
+        if len(bounds) <= 2:
+            np.take(codes, self.renderIdx(originalImg, len(pxlSet), reso), out=out[:, :cols], mode="clip")
+        else:
+            h = originalImg.shape[0]
+
+            def renderBand(r0: int, r1: int) -> None:  # cv2 & numpy release the GIL
+                idx = self.renderIdx(originalImg[r0 * h // rows:r1 * h // rows], len(pxlSet), (cols, r1 - r0), r0)
+                np.take(codes, idx, out=out[r0:r1, :cols], mode="clip")
+
+            for f in [self.threadPool().submit(renderBand, r0, r1) for r0, r1 in zip(bounds, bounds[1:])]:
+                f.result()
+        return out.tobytes().decode("utf-32-le")[:-1]
+
+    def renderBatch(self, start: int, stop: int) -> List[str]:
+        """
+        Render the loaded frames `[start, stop)` with the current pixel set, the same as `render` frame by frame
+
+        Frames too small to be cut into bands are rendered in parallel on the thread pool (with more than one core).
+
+        Params
+        ------
+            - `start`: index of the first frame
+            - `stop`: index after the last frame
+        """
+        imgs = self.imgBook[start:stop]
+        pxlSet, reso, bands = self.pixelSet, tuple(self.reso), self.bands  # the same for the whole batch
+        if len(imgs) <= 1 or os.cpu_count() == 1 or len(self.bandBounds(imgs[0].shape, reso, bands)) > 2:
+            return [self.__render(x, pxlSet, reso, bands) for x in imgs]
+        # serial inside the pool: a worker waiting on bands queued behind the other frames would deadlock
+        return list(self.threadPool().map(lambda x: self.__render(x, pxlSet, reso, 1), imgs))
+
+    def renderIdxBatch(self, imgs: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Return the indices in the pixel set of the cells of frames (`renderIdx`), computed in parallel on the thread pool
+        (with more than one core)
+
+        Param
+        -----
+            - `imgs`: 1-channel grey pictures
+        """
+        setLen, reso = len(self.pixelSet), tuple(self.reso)
+        if len(imgs) <= 1 or os.cpu_count() == 1:
+            return [self.renderIdx(x, setLen, reso) for x in imgs]
+        return list(self.threadPool().map(lambda x: self.renderIdx(x, setLen, reso), imgs))
+
+    def threadPool(self):
+        """
+        Return the persistent thread pool rendering the bands & batches
+        """
+        if self.__pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.__pool = ThreadPoolExecutor(os.cpu_count())
+        return self.__pool
+
+    def bandBounds(self, shape: tuple, reso: tuple | None = None, bands: int | None = None) -> List[int]:
+        """
+        Return the cell rows bounding the bands a frame is rendered in (`[0, rows]` when serial)
+
+        A band may only start at a cell row whose top edge is a whole row of the original image
+        (so the area resize of every band is the same as of the whole frame), and only when downscaling.
+
+        Params
+        ------
+            - `shape`: shape of the original image
+            - `reso`: resolution of the cells, `self.reso` by default
+            - `bands`: max number of bands, `self.bands` by default
+        """
+        (cols, rows), bands = reso or self.reso, bands or self.bands
+        if self.pixelMode == 3:
+            from V2SAtlas import SHAPE_GRID as grid
+        else:
+            grid = SUBCELL_GRIDS.get(self.pixelMode, (1, 1))
+        gw, gh = grid
+        if bands <= 1 or cols * rows < BAND_MIN_CELLS or shape[0] < rows * gh or shape[1] < cols * gw:
+            return [0, rows]
+        step = rows // gcd(rows, shape[0])  # cell rows between two aligned edges
+        n = min(bands, rows // step)
+        return [round(k * (rows // step) / n) * step for k in range(n + 1)]
     
     def setVideoAttr(self, **kwargs) -> bool:
         """
@@ -160,6 +498,8 @@ class V2SConverter:
             - `pixelMode`: int
             - `pixelArgs`: dict
             - `font`: str
+            - `dither`: bool
+            - `bands`: int
         """
         self.reso = kwargs.get("reso", self.reso)
         pixelMode = kwargs.get("pixelMode", self.pixelMode)
@@ -167,9 +507,28 @@ class V2SConverter:
         if self.pixelMode != pixelMode:
             self.pixelMode = pixelMode
             self.pixelSet = np.array(list(PixelFactory.getPxls(pixelMode, **kwargs.get("pixelArgs", DEFAULT_PIXEL_KWARGS))))
+        self.memBudget = kwargs.get("memBudget", self.memBudget)
+        self.bands = kwargs.get("bands", self.bands)
+        if (dither := kwargs.get("dither", self.dither)) != self.dither:
+            self.dither = dither
+            if self.imgInfoList:  # re-render lazily
+                self.imgInfoList = [None] * len(self.imgInfoList)
         self.currentVideoInfo = (self.reso, self.pixelMode, self.font)
         return True
     
+    def getPreview(self, perc: float) -> str:
+        """
+        Render the thumbnail of the image with index `round(perc * len(self.previewBook))` at the current resolution
+        (the full image if there is no thumbnail)
+
+        Param
+        -----
+            - `perc`: progress percentage (from `0` to `1`, inclusive)
+        """
+        if not self.previewBook:
+            return self.getFrame(perc)
+        return self.render(self.previewBook[round(perc * (len(self.previewBook) - 1))], self.pixelSet)
+
     def getFrame(self, perc: float) -> str:
         """
         Get the image with index `round(perc * len(self.renderedImgs))`
@@ -181,46 +540,242 @@ class V2SConverter:
         i = round(perc * (len(self.renderedImgs) - 1))
         if self.currentVideoInfo == self.imgInfoList[i]:
             return self.renderedImgs[i]
+        if self.renderedImgs[i] is not None:
+            self.__renderedBytes -= sys.getsizeof(self.renderedImgs[i])
         self.imgInfoList[i] = self.currentVideoInfo
-        self.renderedImgs[i] = self.render(self.imgBook[i], self.pixelSet)
-        return self.renderedImgs[i]
+        self.renderedImgs[i] = img = self.render(self.imgBook[i], self.pixelSet)
+        self.__renderedBytes += sys.getsizeof(img)
+
+        if self.memBudget is not None:  # evict the oldest rendered frames
+            self.__rendered.append(i)
+            while len(self.__rendered) > 1 and self.__imgBookBytes + self.__previewBytes + self.__renderedBytes > self.memBudget:
+                j = self.__rendered.popleft()
+                if j != i and self.renderedImgs[j] is not None:
+                    self.__renderedBytes -= sys.getsizeof(self.renderedImgs[j])
+                    self.renderedImgs[j] = self.imgInfoList[j] = None
+        return img
+
+    def memoryReport(self) -> dict:
+        """
+        Return the bytes taken by every structure of the converter
+        """
+        return {
+            "imgBook": self.__imgBookBytes,
+            "renderedImgs": self.__renderedBytes + (sys.getsizeof(self.renderedImgs) if self.renderedImgs else 0),
+            "imgInfoList": sys.getsizeof(self.imgInfoList) if self.imgInfoList else 0,
+            "pixelSet": self.pixelSet.nbytes,
+            "lrcList": sum(sys.getsizeof(x[1]) for x in self.lrcList),
+            "previewBook": self.__previewBytes,
+        }
+
+    def memAvailable(self) -> int | None:
+        """
+        Return the bytes left in the memory budget (`None` for unlimited)
+        """
+        if self.memBudget is None:
+            return None
+        return self.memBudget - sum(self.memoryReport().values())
+
+    def __initRendered(self) -> None:
+        """
+        Reset the cache of rendered frames after a video is loaded, and fit the frames & their thumbnails in the budget
+        """
+        self.__previewBytes = sum(x.nbytes for x in self.previewBook) if self.previewBook else 0
+        if self.memBudget is not None and sum(x.nbytes for x in self.imgBook) + self.__previewBytes > self.memBudget:
+            for i, x in enumerate(self.imgBook):  # in place, a single frame is converted at a time
+                if isinstance(x, np.ndarray) and x.dtype != np.uint8:
+                    self.imgBook[i] = (x * 255).round().astype(np.uint8)
+        self.__imgBookBytes = sum(x.nbytes for x in self.imgBook)
+        if self.memBudget is not None and self.__imgBookBytes + self.__previewBytes > self.memBudget:
+            raise MemoryError(f"The video needs {(self.__imgBookBytes + self.__previewBytes) / 2**20:.0f} MB even as uint8, "
+                              f"over the memory budget of {self.memBudget / 2**20:.0f} MB")
+        self.renderedImgs = [None] * len(self.imgBook)
+        self.imgInfoList = [None] * len(self.imgBook)
+        self.__rendered = deque()
+        self.__renderedBytes = 0
     
-    def saveProcessed(self, filePath: str) -> bool:
+    def getLrcIdx(self, t: float) -> int:
         """
-        Save processed video (equivalent to saving the class status)
+        Get the index of the lyrics shown at time `t`
 
         Param
         -----
+            - `t`: time in seconds
+        """
+        return max(0, bisect_left(self.lrcList, t + 1e-6, key=lambda x: x[0]) - 1)
+
+    def exportVideo(self, filePath: str, tileSize: tuple = (6, 11), workers: int | None = None, window: int = 8,
+                    audioPath: str | None = "buffer.mp3", lyrics: bool = True, progress: Callable[[float], None] | None = None) -> bool:
+        """
+        Export the converted video to an mp4 file.
+
+        Frames are rasterized through the cached glyph atlas across a process pool and
+        written in order at the source fps; at most `window` chunks are in flight at a time,
+        and the frames are sent to the workers shrunk to the cell grid (as uint8 or float32).
+
+        Params
+        ------
             - `filePath`: path of file to be saved
+            - `tileSize`: size of one cell on the exported image, as `(w, h)`
+            - `workers`: number of rasterizing processes (`None` for all the cores)
+            - `window`: max number of chunks in flight, bounding the memory usage
+            - `audioPath`: the cached audio to be muxed (`None` to export without sound)
+            - `lyrics`: whether to burn in the lyrics at the right side
+            - `progress`: called with the fraction of frames written
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        lrcWidth = 2 * tileSize[1] if lyrics and self.lDir else 0
+        size = (self.reso[0] * tileSize[0] + lrcWidth, self.reso[1] * tileSize[1])
+        muxAudio = audioPath and os.path.exists(audioPath)
+        videoPath = filePath + ".noaudio.mp4" if muxAudio else filePath
+        writer = cv2.VideoWriter(videoPath, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, size)
+
+        inFlight = deque()
+        written = 0
+        grid = self.gridSize()
+
+        def shrink(img: np.ndarray | PackedFrame) -> np.ndarray:
+            if isinstance(img, PackedFrame):
+                img = img.unpack()
+            if img.shape[1] > grid[0] and img.shape[0] > grid[1]:
+                img = cv2.resize(img, grid, interpolation=cv2.INTER_AREA)
+            return img if img.dtype == np.uint8 else img.astype(np.float32)
+
+        def writeChunk() -> None:
+            nonlocal written
+            for img in inFlight.popleft().result():
+                writer.write(cv2.cvtColor(img, cv2.COLOR_GRAY2BGR))
+                written += 1
+            if progress:
+                progress(written / len(self.imgBook))
+
+        try:
+            with ProcessPoolExecutor(
+                workers,
+                initializer=_initExporter,
+                initargs=(self.reso, self.pixelMode, self.pixelSet, self.font, self.dither, tileSize, lrcWidth),
+            ) as pool:
+                for start in range(0, len(self.imgBook), EXPORT_CHUNK):
+                    stop = min(start + EXPORT_CHUNK, len(self.imgBook))
+                    lrcs = [self.lrcList[self.getLrcIdx(i / self.fps)][1] for i in range(start, stop)] if lrcWidth else []
+                    inFlight.append(pool.submit(_exportChunk, [shrink(x) for x in self.imgBook[start:stop]], lrcs))
+                    if len(inFlight) >= window:
+                        writeChunk()
+                while inFlight:
+                    writeChunk()
+        except BaseException:
+            for future in inFlight:
+                future.cancel()
+            writer.release()
+            os.remove(videoPath)
+            raise
+        writer.release()
+
+        if muxAudio:
+            import subprocess
+            from imageio_ffmpeg import get_ffmpeg_exe
+            subprocess.run([
+                get_ffmpeg_exe(), "-y", "-loglevel", "error",
+                "-i", videoPath, "-i", audioPath,
+                "-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-shortest",
+                filePath,
+            ], check=True)
+            os.remove(videoPath)
+        return True
+
+    def saveProcessed(self, filePath: str, progress: Callable[[float], None] | None = None) -> bool:
+        """
+        Save processed video (equivalent to saving the class status)
+
+        Params
+        ------
+            - `filePath`: path of file to be saved
+            - `progress`: called with the fraction of bytes written
         """
         import pickle
         with open(filePath, "bw") as f:
-            pickle.dump([
-                self.currentVideoInfo,
-                self.fps,
-                self.imgBook,
-                self.pixelSet,
-                self.lrcList,
-                self.vDir,
-                self.lDir,
-            ], f)
+            try:
+                pickle.dump([
+                    self.currentVideoInfo,
+                    self.fps,
+                    self.imgBook,
+                    self.pixelSet,
+                    self.lrcList,
+                    self.vDir,
+                    self.lDir,
+                    self.previewBook,
+                ], ProgressFile(f, self.__imgBookBytes, progress) if progress else f)
+            except BaseException:  # never leave a half-written file behind
+                f.close()
+                os.remove(filePath)
+                raise
         return True
     
-    def loadProcessed(self, filePath: str) -> bool:
+    def loadProcessed(self, filePath: str, audioPath: str | None = "buffer.mp3", progress: Callable[[float], None] | None = None) -> bool:
         """
         Load processed video (equivalent to loading the class status)
 
-        Param
-        -----
+        Params
+        ------
             - `filePath`: path of file to be loaded
+            - `audioPath`: where the music is extracted to (`None` to skip the music)
+            - `progress`: called with the fraction of bytes read
         """
         import pickle
-        from moviepy.editor import VideoFileClip
         with open(filePath, "br") as f:
-            self.currentVideoInfo, self.fps, self.imgBook, \
-                self.pixelSet, self.lrcList, self.vDir, self.lDir = pickle.load(f)
+            state = pickle.load(ProgressFile(f, os.path.getsize(filePath), progress) if progress else f)
+        self.currentVideoInfo, self.fps, self.imgBook, self.pixelSet, self.lrcList, self.vDir, self.lDir = state[:7]
+        # files saved before the thumbnails were kept have none
+        self.previewBook = state[7] if len(state) > 7 else [makePreview(x) for x in self.imgBook]
         self.reso, self.pixelMode, self.font = self.currentVideoInfo
-        self.renderedImgs = [None] * len(self.imgBook)
-        self.imgInfoList = [None] * len(self.imgBook)
-        VideoFileClip(self.vDir).audio.write_audiofile("buffer.mp3")
+        self.__initRendered()
+        if audioPath:
+            from moviepy.editor import VideoFileClip
+            VideoFileClip(self.vDir).audio.write_audiofile(audioPath)
         return True
+
+
+def makePreview(img: np.ndarray | PackedFrame) -> np.ndarray:
+    """
+    Shrink a grey image to a uint8 thumbnail `PREVIEW_WIDTH` pixels wide
+    """
+    if isinstance(img, PackedFrame):
+        img = img.unpack()
+    h, w = img.shape
+    img = cv2.resize(img, (PREVIEW_WIDTH, max(round(h * PREVIEW_WIDTH / w), 1)), interpolation=cv2.INTER_AREA)
+    return img if img.dtype == np.uint8 else (img * 255).round().astype(np.uint8)
+
+
+# States of an export process, built once by `_initExporter`
+_exporter = None
+
+def _initExporter(reso: tuple, pixelMode: int, pixelSet: np.ndarray[Any, str], font: str, dither: bool,
+                  tileSize: tuple, lrcWidth: int) -> None:
+    """
+    Initialize an export process with a renderer, the glyph atlas and the lyrics font
+    """
+    global _exporter
+    from PIL import ImageFont
+    from V2SAtlas import getAtlas
+    converter = V2SConverter(reso, 1, 0, font=font)
+    converter.pixelMode, converter.pixelSet, converter.dither = pixelMode, pixelSet, dither
+    atlas = getAtlas("".join(pixelSet), font, tileSize)
+    lrcFont = ImageFont.truetype(atlas.fontFilePath, tileSize[1]) if lrcWidth else None
+    _exporter = (converter, atlas, atlas.lookup(pixelSet), lrcWidth, lrcFont)
+
+def _exportChunk(imgs: List[np.ndarray], lrcs: List[str]) -> List[np.ndarray]:
+    """
+    Rasterize a chunk of frames (with the lyrics burnt in if given) to grey images
+    """
+    from PIL import Image, ImageDraw
+    converter, atlas, remap, lrcWidth, lrcFont = _exporter
+    ans = []
+    for i, idx in enumerate(converter.renderIdxBatch(imgs)):
+        img = atlas.compose(remap[idx])
+        if lrcWidth:
+            panel = Image.new("L", (lrcWidth, img.shape[0]), 0)
+            ImageDraw.Draw(panel).multiline_text((lrcWidth // 4, 0), lrcs[i], font=lrcFont, fill=255)
+            img = np.hstack([img, np.asarray(panel)])
+        ans.append(img)
+    return ans
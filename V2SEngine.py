@@ -1,13 +1,167 @@
+import sys
 from itertools import starmap
 from os import environ
-from time import sleep
-from typing import List, Tuple
+from time import sleep, perf_counter
+from typing import Callable, Tuple
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 
-import pygame
-from bisect import bisect_left
 from transitions import Machine, EventData
 from V2SConverter import V2SConverter
+from V2SFrameStore import DeltaFrameStore
+
+BUFFER_BATCH = 32  # frames rendered at once when prerendering
+QOS_LEVELS = (1.0, 0.8, 0.65, 0.5, 0.35)  # scales of the resolution, from high to low
+
+class ResoGovernor:
+    """
+    Quality-of-service controller of the resolution played under strategy `1`
+
+    It watches the render time per frame and steps the resolution down through `levels`
+    when the budget is missed, and back up when the estimated cost of the upper level
+    fits in the budget again. Both directions need consecutive frames (hysteresis).
+
+    Params
+    ------
+    - `budget`: render time allowed per frame (in seconds)
+    - `levels`: scales of the resolution, from high to low (tuple)
+    - `downAfter`: consecutive missed frames before stepping down (int)
+    - `upAfter`: consecutive frames with headroom before stepping up (int)
+    - `headroom`: fraction of the budget the upper level is expected to use at most (float)
+    """
+    def __init__(self, budget: float, levels: tuple = QOS_LEVELS, downAfter: int = 3, upAfter: int = 30, headroom: float = 0.8) -> None:
+        self.budget = budget
+        self.levels = levels
+        self.downAfter = downAfter
+        self.upAfter = upAfter
+        self.headroom = headroom
+        self.level = 0
+        self.__miss = self.__slack = 0
+
+    def scale(self) -> float:
+        """
+        Return the scale of the current level
+        """
+        return self.levels[self.level]
+
+    def scaleReso(self, reso: tuple) -> tuple:
+        """
+        Scale a resolution by the current level
+
+        Param
+        -----
+        - `reso`: the full resolution
+        """
+        return tuple(max(int(x * self.scale()), 1) for x in reso)
+
+    def feed(self, cost: float) -> bool:
+        """
+        Feed the render time of a frame, return whether the level is changed
+
+        Param
+        -----
+        - `cost`: render time of the frame (in seconds)
+        """
+        if cost > self.budget:
+            self.__miss, self.__slack = self.__miss + 1, 0
+            if self.__miss >= self.downAfter and self.level + 1 < len(self.levels):
+                self.level, self.__miss = self.level + 1, 0
+                return True
+            return False
+
+        self.__miss = 0
+        # render time grows with the number of cells
+        if self.level and cost * (self.levels[self.level - 1] / self.scale()) ** 2 < self.budget * self.headroom:
+            self.__slack += 1
+            if self.__slack >= self.upAfter:
+                self.level, self.__slack = self.level - 1, 0
+                return True
+        else:
+            self.__slack = 0
+        return False
+
+
+class PygameClock:
+    """
+    Audio/clock backend of the engine: plays the music with `pygame.mixer.music` on the wall clock.
+
+    A backend follows the interface of `pygame.mixer.music` (`load`, `play`, `pause`, `unpause`,
+    `unload`, `get_pos`), plus `sleep` & `time` for the clock.
+    """
+    def __init__(self) -> None:
+        import pygame
+        pygame.init()
+        self.music = pygame.mixer.music
+
+    def load(self, path: str) -> None:
+        self.music.load(path)
+
+    def play(self, start: float = 0.0) -> None:
+        self.music.play(start=start)
+
+    def pause(self) -> None:
+        self.music.pause()
+
+    def unpause(self) -> None:
+        self.music.unpause()
+
+    def unload(self) -> None:
+        self.music.unload()
+
+    def get_pos(self) -> int:
+        """
+        Return the milliseconds played since the last `play`
+        """
+        return self.music.get_pos()
+
+    def sleep(self, sec: float) -> None:
+        sleep(sec)
+
+    def time(self) -> float:
+        return perf_counter()
+
+
+class VirtualClock:
+    """
+    Audio/clock backend without audio, whose time only advances on `sleep`.
+
+    Playback under it is deterministic and runs headless as fast as the engine can go.
+    """
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.__played = 0.0  # seconds played before `__since`
+        self.__since = None  # virtual time of the last play/unpause, `None` when paused
+
+    def load(self, path: str) -> None:
+        ...
+
+    def play(self, start: float = 0.0) -> None:
+        self.__played, self.__since = 0.0, self.now
+
+    def pause(self) -> None:
+        if self.__since is not None:
+            self.__played += self.now - self.__since
+            self.__since = None
+
+    def unpause(self) -> None:
+        if self.__since is None:
+            self.__since = self.now
+
+    def unload(self) -> None:
+        self.pause()
+
+    def get_pos(self) -> int:
+        """
+        Return the milliseconds played since the last `play`
+        """
+        played = self.__played + (self.now - self.__since if self.__since is not None else 0)
+        return int(played * 1000)
+
+    def sleep(self, sec: float) -> None:
+        self.now += sec
+
+    def time(self) -> float:
+        return self.now
+
 
 class V2SEngine:
     """
@@ -17,9 +171,13 @@ class V2SEngine:
     ------
     - `converter`: Initialized V2SConverter
     - `strategy`: playing strategy. `0`: render before playing; `1`: render when playing (int)
+    - `qos`: whether to adapt the resolution to the render time under strategy `1` (bool)
+    - `clock`: audio/clock backend, `PygameClock` by default (`VirtualClock` for headless runs)
+
+    When `trace` is a list, every frame presented by `getCurInfo` is recorded in it
+    as `(clock time, frame index, lyrics index)`.
 
-    TODO:
-        - Optimize the memory usage while ensuring the 2 strategies compatible
+    Frames prerendered by strategy `0` are kept in a `DeltaFrameStore` (keyframes & row deltas).
 
     """
     __states = ["onPlay", "onPause", "onPlayingDrag", "onPausingDrag", "destroyed"]
@@ -32,41 +190,51 @@ class V2SEngine:
         {"trigger": "releasePause",    "source": "onPausingDrag",  "dest": "onPause"},
         {"trigger": "destroy",         "source": "*",              "dest": "destroyed"},
     ]
-    def __init__(self, converter: V2SConverter, strategy: int) -> None:
-        pygame.init()
+    def __init__(self, converter: V2SConverter, strategy: int, qos: bool = False, clock: PygameClock | VirtualClock | None = None,
+                 buffer: bool = True) -> None:
         self.strategy = strategy
         self.converter = converter
-        self.player = pygame.mixer.music
+        self.baseReso = self.converter.reso
+        # half of the frame period is left for the display
+        self.governor = ResoGovernor(0.5 / self.converter.fps) if qos and strategy else None
+        self.player = clock if clock else PygameClock()
+        self.trace = None
         self.totalSec = len(self.converter.imgBook) / self.converter.fps
         self.machine = Machine(self, states=V2SEngine.__states, transitions=V2SEngine.__trans, initial="onPause", send_event=True)
         self.base = 0  # disgusting pygame arg
         self.curLrcIdx = 0
         self.__now = 0  # 0-1
-        self.bufferedImgs = []
-        if not self.strategy:
+        self.bufferedImgs = DeltaFrameStore()
+        if not self.strategy and buffer:
             self.bufferImages()
         self.player.load("buffer.mp3")
         self.player.play()
         self.player.pause()
 
     def loop(self) -> None:   # should NOT be called by the main thread
-        while 1:
-            match self.state:
-                case "destroyed":
-                    self.player.unload()
-                    return
-                case "onPlay":
-                    self.__now = (self.player.get_pos() / 1000) / self.totalSec + self.base
-                    if (newIdx := self.curLrcIdx + 1) != len(self.converter.lrcList) and self.__now * self.totalSec >= self.converter.lrcList[newIdx][0]:
-                        self.curLrcIdx = newIdx
-                    if self.__now >= 0.999:  # Completed playing
-                        if "Drag" in self.state:
-                            self.release()
-                        self.switch(None)
-                        self.setPerc(0)
-                case _:
-                    ...
-            sleep(1 / self.converter.fps)  # CRUCIAL to performance, avoid redundant updates
+        while self.step():
+            self.player.sleep(1 / self.converter.fps)  # CRUCIAL to performance, avoid redundant updates
+
+    def step(self) -> bool:
+        """
+        Update the engine for one tick of the clock, return `False` once destroyed
+        """
+        match self.state:
+            case "destroyed":
+                self.player.unload()
+                return False
+            case "onPlay":
+                self.__now = (self.player.get_pos() / 1000) / self.totalSec + self.base
+                if (newIdx := self.curLrcIdx + 1) != len(self.converter.lrcList) and self.__now * self.totalSec >= self.converter.lrcList[newIdx][0]:
+                    self.curLrcIdx = newIdx
+                if self.__now >= 0.999:  # Completed playing
+                    if "Drag" in self.state:
+                        self.release()
+                    self.switch(None)
+                    self.setPerc(0)
+            case _:
+                ...
+        return True
     
     def switch(self, e: EventData | None = None) -> None:
         """
@@ -98,13 +266,26 @@ class V2SEngine:
         Return the current view of the engine, containing the current frame and lyrics
         """
         match self.strategy:
+            case 1 if "Drag" in self.state:
+                img = self.converter.getPreview(self.__now)
             case 1:
+                t = perf_counter()
                 img = self.converter.getFrame(self.__now)
+                if self.governor and self.governor.feed(perf_counter() - t):
+                    self.converter.setVideoAttr(reso=self.governor.scaleReso(self.baseReso))
             case 0:
-                img = self.bufferedImgs[round(self.__now * (len(self.bufferedImgs) - 1))]
+                # frames not buffered yet are rendered on the fly
+                if (i := round(self.__now * (len(self.converter.imgBook) - 1))) < len(self.bufferedImgs):
+                    img = self.bufferedImgs[i]
+                elif "Drag" in self.state:
+                    img = self.converter.getPreview(self.__now)
+                else:
+                    img = self.converter.getFrame(self.__now)
             case _:
                 img = ""
         lrc = self.converter.lrcList[self.curLrcIdx][1]
+        if self.trace is not None:
+            self.trace.append((self.player.time(), round(self.__now * (len(self.converter.imgBook) - 1)), self.curLrcIdx))
         return img, lrc
     
     def setPerc(self, t: float) -> None:
@@ -130,21 +311,91 @@ class V2SEngine:
         self.base = self.__now = t
         t = self.__now * self.totalSec
                 
-        self.curLrcIdx = max(0, bisect_left(self.converter.lrcList, t + 1e-6, key=lambda x: x[0]) - 1)
+        self.curLrcIdx = self.converter.getLrcIdx(t)
 
         self.player.play(start=t)
         self.player.pause()
         if self.state in ["onPlayingDrag", "onPausingDrag"]:
             self.release()
     
-    def bufferImages(self) -> List[str]:
+    def drag(self, t: float) -> None:
+        """
+        Move the engine process while the progress bar is dragged
+
+        The engine stays in a drag state (with the music paused) and shows the thumbnails of the
+        converter; the music is only sought once by `setPerc` when the bar is released.
+
+        Param
+        -----
+        - `t`: process denoted as percentage (from 0 to 1)
+        """
+        if not 0 <= t <= 1:
+            raise ValueError(f"Expected time to be in [0, 1], while given {t}")
+
+        match self.state:
+            case "onPlay":
+                self.player.pause()
+                self.dragAtPlay()
+            case "onPause":
+                self.dragAtPause()
+            case _:
+                ...
+        self.__now = t
+        self.curLrcIdx = self.converter.getLrcIdx(t * self.totalSec)
+
+    def setBaseReso(self, reso: tuple) -> None:
         """
-        Render and return the list of rendered images from loaded video
+        Set the full resolution, which is scaled by the governor if any
+
+        Param
+        -----
+        - `reso`: the full resolution
         """
-        self.bufferedImgs = [
-            self.converter.render(x, self.converter.pixelSet)
-            for x in self.converter.imgBook
-        ]
+        self.baseReso = reso
+        if self.governor:
+            reso = self.governor.scaleReso(reso)
+        self.converter.setVideoAttr(reso=reso)
+
+    def bufferImages(self, progress: Callable[[float], None] | None = None) -> DeltaFrameStore:
+        """
+        Render and return the store of rendered images from loaded video
+
+        The store is filled in place, so it can be played while being buffered (from another thread).
+        Raise `MemoryError` if the store does not fit in the memory budget of the converter.
+
+        Param
+        -----
+        - `progress`: called with the fraction of frames buffered
+        """
+        self.bufferedImgs = store = DeltaFrameStore()
+        budget = self.converter.memAvailable()
+        n = len(self.converter.imgBook)
+        start = 0
+        while start < n:
+            # under a budget, the first frame sizes the batches, whose full frames (until stored as deltas)
+            # hold at most an eighth of the budget left
+            batch = BUFFER_BATCH
+            if budget is not None:
+                batch = max(min(batch, (budget - store.nbytes()) // (8 * sys.getsizeof(store.frames[0])) if store.frames else 1), 1)
+            for frame in self.converter.renderBatch(start, start + batch):
+                store.append(frame)
+            start += batch
+            if progress:
+                progress(len(store) / n)
+            if budget is None:
+                continue
+            # keyframes alone are a lower bound of the whole store
+            if sys.getsizeof(store.frames[0]) * n / store.keyInterval > budget or store.nbytes() > budget:
+                self.bufferedImgs = DeltaFrameStore()
+                raise MemoryError(f"Prerendering does not fit in the {max(budget, 0) / 2**20:.0f} MB left in the memory budget, "
+                                  "the frames are rendered when played instead")
+        return store
+
+    def memoryReport(self) -> dict:
+        """
+        Return the bytes taken by every structure of the engine & its converter
+        """
+        return self.converter.memoryReport() | {"bufferedImgs": self.bufferedImgs.nbytes()}
 
     def release(self) -> None:
         """
@@ -159,5 +410,12 @@ class V2SEngine:
             case _:
                 ...
 
+    def on_enter_destroyed(self, e: EventData) -> None:
+        """
+        Give the full resolution back to the converter, which outlives the engine
+        """
+        if self.governor:
+            self.converter.setVideoAttr(reso=self.baseReso)
+
     def on_enter_destroy(self) -> None:
-        self = V2SEngine(self.converter, self.strategy)
\ No newline at end of file
+        self = V2SEngine(self.converter, self.strategy, bool(self.governor), self.player)
\ No newline at end of file
@@ -0,0 +1,181 @@
+import sys
+import numpy as np
+from typing import List, Tuple
+
+KEYFRAME_INTERVAL = 64
+PACK_BITS = (1, 2, 4)  # bits per pixel of the packed frames
+LEVEL_TOLERANCE = 2.0  # max RMS error (in grey levels of 255) of quantizing a video to few levels
+
+class DeltaFrameStore:
+    """
+    In-memory store of prerendered char pictures.
+
+    Every `keyInterval`-th frame is kept as a full string (keyframe); the others only keep
+    the rows that differ from their predecessor, unless the full string is smaller (then a keyframe too).
+    Random access reconstructs from the nearest keyframe, while sequential reading applies the deltas incrementally.
+
+    Param
+    -----
+    - `keyInterval`: number of frames between two keyframes (int)
+    """
+    def __init__(self, keyInterval: int = KEYFRAME_INTERVAL) -> None:
+        self.keyInterval = keyInterval
+        self.frames: List[str | Tuple[Tuple[int, str], ...]] = []  # str: keyframe; tuple: row deltas
+        self.__tail = None  # rows of the last appended frame
+        self.__curIdx = -1  # the last read frame
+        self.__curRows = self.__cur = None
+        self.__nbytes = 0  # bytes of the stored frames
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def append(self, frame: str) -> None:
+        """
+        Append a frame to the end of the store
+
+        Param
+        -----
+            - `frame`: char picture whose rows are joined by `\\n`
+        """
+        rows = frame.split("\n")
+        if len(self.frames) % self.keyInterval == 0 or self.__tail is None or len(rows) != len(self.__tail):
+            self.frames.append(frame)
+            self.__nbytes += sys.getsizeof(frame)
+        else:
+            delta = tuple((i, r) for i, (r, p) in enumerate(zip(rows, self.__tail)) if r != p)
+            cost = sys.getsizeof(delta) + sum(sys.getsizeof(d) + sys.getsizeof(d[1]) for d in delta)
+            if cost < sys.getsizeof(frame):
+                self.frames.append(delta)
+                self.__nbytes += cost
+            else:  # most rows changed, the full frame is smaller
+                self.frames.append(frame)
+                self.__nbytes += sys.getsizeof(frame)
+        self.__tail = rows
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self.frames)
+        if i == self.__curIdx:
+            return self.__cur
+        if isinstance(self.frames[i], str):
+            self.__curIdx, self.__curRows, self.__cur = i, None, self.frames[i]
+            return self.__cur
+
+        k = i
+        while not isinstance(self.frames[k], str):
+            k -= 1
+        if k <= self.__curIdx < i:  # move forward from the last read frame
+            start, rows = self.__curIdx, self.__curRows or self.__cur.split("\n")
+        else:
+            start, rows = k, self.frames[k].split("\n")
+        for j in range(start + 1, i + 1):
+            for r, row in self.frames[j]:
+                rows[r] = row
+
+        self.__curIdx, self.__curRows, self.__cur = i, rows, "\n".join(rows)
+        return self.__cur
+
+    def nbytes(self) -> int:
+        """
+        Return the approximate resident size of the stored frames (in bytes)
+        """
+        return sys.getsizeof(self.frames) + self.__nbytes
+
+
+def findLevels(hist: np.ndarray, tolerance: float = LEVEL_TOLERANCE) -> np.ndarray | None:
+    """
+    Return the fewest grey levels (2, 4 or 16) quantizing a video within `tolerance`, or `None`
+
+    The levels of every count are fitted by k-means on the histogram of the video, starting from its quantiles
+    and from even steps over its range (the quantiles collapse when a value dominates, e.g. a black background),
+    then snapped to the most frequent value of their clusters.
+
+    Params
+    ------
+        - `hist`: histogram of the grey values (0-255) of all the frames
+        - `tolerance`: max RMS error of the quantization
+    """
+    hist = np.asarray(hist, dtype=float).ravel()
+    values = np.arange(256)
+    total = hist.sum()
+    if not total:
+        return None
+    cdf = np.cumsum(hist) / total
+    lo, hi = np.flatnonzero(hist)[[0, -1]]
+    for bits in PACK_BITS:
+        k = 2**bits
+        levels = min(
+            (_fitLevels(hist, np.unique(start)) for start in (
+                np.searchsorted(cdf, (np.arange(k) + 0.5) / k),
+                np.rint(np.linspace(lo, hi, k)).astype(int),
+            )),
+            key=lambda x: quantError(hist, x),
+        )
+        if quantError(hist, levels) <= tolerance:
+            return levels.astype(np.uint8)
+    return None
+
+
+def _fitLevels(hist: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    """
+    Fit grey levels to a histogram by k-means from the sorted initial `levels`,
+    and snap every level to the most frequent value of its cluster, so pure black & white stay exact
+    """
+    values = np.arange(256)
+    for _ in range(32):
+        idx = np.searchsorted((levels[1:] + levels[:-1]) / 2, values)  # nearest level of every value
+        count = np.bincount(idx, hist, len(levels))
+        means = np.bincount(idx, hist * values, len(levels)) / np.maximum(count, 1)
+        new = np.unique(np.where(count > 0, np.rint(means), levels).astype(int))
+        if len(new) == len(levels) and (new == levels).all():
+            break
+        levels = new
+    idx = np.searchsorted((levels[1:] + levels[:-1]) / 2, values)
+    return np.array([values[idx == j][hist[idx == j].argmax()] for j in range(len(levels))])
+
+
+def quantError(hist: np.ndarray, levels: np.ndarray) -> float:
+    """
+    Return the RMS error (in grey levels of 255) of quantizing the grey values of a histogram to `levels`
+
+    Params
+    ------
+        - `hist`: histogram of the grey values (0-255)
+        - `levels`: the sorted grey levels
+    """
+    hist = np.asarray(hist, dtype=float).ravel()
+    values, levels = np.arange(256), np.asarray(levels, dtype=int)
+    idx = np.searchsorted((levels[1:] + levels[:-1]) / 2, values)
+    return float(np.sqrt((hist * (values - levels[idx]) ** 2).sum() / max(hist.sum(), 1)))
+
+
+class PackedFrame:
+    """
+    A grey frame quantized to a few levels, packed to 1, 2 or 4 bits per pixel.
+
+    Params
+    ------
+    - `img`: the uint8 grey frame
+    - `levels`: the sorted grey levels (uint8) the frame is quantized to, at most 16
+    """
+    def __init__(self, img: np.ndarray, levels: np.ndarray) -> None:
+        self.shape = img.shape
+        self.levels = levels
+        self.bits = next(b for b in PACK_BITS if 2**b >= len(levels))
+        lut = np.searchsorted((levels[1:].astype(int) + levels[:-1]) / 2, np.arange(256)).astype(np.uint8)
+        codes = lut[img.ravel()]
+        per = 8 // self.bits  # pixels per byte
+        codes = np.pad(codes, (0, -len(codes) % per)).reshape(-1, per)
+        self.data = np.bitwise_or.reduce(codes << (np.arange(per, dtype=np.uint8) * self.bits), axis=1)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.levels.nbytes
+
+    def unpack(self) -> np.ndarray:
+        """
+        Return the quantized frame as a uint8 grey image
+        """
+        per = 8 // self.bits
+        codes = (self.data[:, None] >> (np.arange(per, dtype=np.uint8) * self.bits)) & (2**self.bits - 1)
+        return self.levels[codes.ravel()[:self.shape[0] * self.shape[1]]].reshape(self.shape)
@@ -0,0 +1,117 @@
+import queue
+from threading import Event
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when it reports progress after being cancelled
+    """
+
+
+class Job:
+    """
+    A background job, reporting its fractional progress to the executor
+
+    Params
+    ------
+    - `label`: name of the job shown in the ui (str)
+    - `onDone`: called with the result of the job in the main thread (callable)
+    - `events`: queue of the executor (queue.Queue)
+    """
+    def __init__(self, label: str, onDone: Callable[[Any], None] | None, events: queue.Queue) -> None:
+        self.label = label
+        self.onDone = onDone
+        self.cancelled = Event()
+        self.__events = events
+        self.__last = -1.0
+
+    def report(self, frac: float) -> None:
+        """
+        Report the progress of the job (from 0 to 1). Raise `JobCancelled` if the job is cancelled.
+
+        Param
+        -----
+            - `frac`: fraction of the job completed
+        """
+        if self.cancelled.is_set():
+            raise JobCancelled(self.label)
+        if frac - self.__last >= 0.01 or frac >= 1 > self.__last:  # no need to flood the ui
+            self.__last = frac
+            self.__events.put(("progress", self, frac))
+
+    def cancel(self) -> None:
+        """
+        Ask the job to stop at its next progress report
+        """
+        self.cancelled.set()
+
+
+class JobExecutor:
+    """
+    Run jobs one at a time on a background thread.
+
+    Progress, results and failures come back through a thread-safe queue, which should be
+    drained by `poll` from the main (Tk) thread.
+    """
+    def __init__(self) -> None:
+        self.events = queue.Queue()
+        self.current = None
+        self.pending = set()  # jobs submitted and not finished yet
+        self.__pool = ThreadPoolExecutor(1)
+
+    def submit(self, label: str, fn: Callable[[Callable[[float], None]], Any], onDone: Callable[[Any], None] | None = None) -> Job:
+        """
+        Queue a job, return its handle
+
+        Params
+        ------
+            - `label`: name of the job shown in the ui
+            - `fn`: the work, called with the progress callback of the job
+            - `onDone`: called with the result of `fn` in the main thread
+        """
+        job = Job(label, onDone, self.events)
+        self.pending.add(job)
+
+        def run() -> None:
+            self.current = job
+            try:
+                job.report(0)
+                event = ("done", job, fn(job.report))
+            except JobCancelled:
+                event = ("cancelled", job, None)
+            except Exception as e:
+                event = ("failed", job, e)
+            self.current = None
+            self.pending.discard(job)  # before the event, so `onDone` sees the executor idle
+            self.events.put(event)
+
+        self.__pool.submit(run)
+        return job
+
+    def cancel(self) -> None:
+        """
+        Cancel the running job, if any
+        """
+        if job := self.current:
+            job.cancel()
+
+    def poll(self) -> list:
+        """
+        Drain the events `(kind, job, value)` queued so far, where kind is one of
+        `["progress", "done", "cancelled", "failed"]`
+        """
+        ans = []
+        while 1:
+            try:
+                ans.append(self.events.get_nowait())
+            except queue.Empty:
+                return ans
+
+    def shutdown(self) -> None:
+        """
+        Cancel the running job and stop the executor
+        """
+        self.cancel()
+        self.__pool.shutdown(wait=False, cancel_futures=True)
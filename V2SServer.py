@@ -0,0 +1,216 @@
+import sys
+import json
+import struct
+import asyncio
+from time import perf_counter
+from typing import Callable, List
+from V2SEngine import V2SEngine
+
+HEADER = struct.Struct("!I")  # length of the message that follows
+
+
+class BroadcastFrame:
+    """
+    A rendered frame, encoded once for all the clients.
+
+    `full` carries the whole frame; `delta` only carries the rows that differ from frame `prev`
+    and can only be sent to clients whose last received frame is `prev`.
+
+    Params
+    ------
+    - `idx`: index of the frame (int)
+    - `prev`: index of the previously broadcast frame (int)
+    - `rows`: rows of the frame (list)
+    - `prevRows`: rows of the previously broadcast frame (list | None)
+    - `lrc`: the current lyrics (str)
+    """
+    def __init__(self, idx: int, prev: int, rows: List[str], prevRows: List[str] | None, lrc: str) -> None:
+        self.idx = idx
+        self.prev = prev
+        self.full = self.encode({"i": idx, "full": "\n".join(rows), "lrc": lrc})
+        self.delta = None
+        if prevRows is not None and len(prevRows) == len(rows):
+            self.delta = self.encode({
+                "i": idx,
+                "base": prev,
+                "rows": [[r, row] for r, (row, p) in enumerate(zip(rows, prevRows)) if row != p],
+                "lrc": lrc,
+            })
+
+    @staticmethod
+    def encode(msg: dict) -> bytes:
+        data = json.dumps(msg, ensure_ascii=False).encode("utf-8")
+        return HEADER.pack(len(data)) + data
+
+
+class V2SBroadcastServer:
+    """
+    Render every frame once following the engine playback clock, and broadcast it to any number
+    of TCP clients (asyncio).
+
+    Every client has its own bounded queue: when it falls behind, its oldest frames are
+    dropped and the next frame is sent in full, so a slow client never stalls the others.
+
+    Params
+    ------
+    - `engine`: Initialized V2SEngine, whose clock drives the broadcast
+    - `host`: host to listen on (str)
+    - `port`: port to listen on (int)
+    - `queueSize`: max number of frames waiting to be sent to a client (int)
+    """
+    def __init__(self, engine: V2SEngine, host: str = "127.0.0.1", port: int = 8765, queueSize: int = 4) -> None:
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.queueSize = queueSize
+        self.clients = set()
+        self.closed = False  # whether the broadcast has ended
+
+    async def serve(self) -> None:
+        """
+        Accept clients and broadcast frames until the engine is destroyed, then close every connection
+        """
+        server = await asyncio.start_server(self.handle, self.host, self.port, backlog=1024)
+        async with server:
+            try:
+                await self.broadcast()
+            finally:
+                self.closed = True
+                for q in self.clients:  # `None` ends the handler of every client
+                    if q.full():
+                        q.get_nowait()
+                    q.put_nowait(None)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Send the queued frames to one client, until the broadcast ends
+        """
+        q = asyncio.Queue(self.queueSize)
+        self.clients.add(q)
+        last = -1
+        try:
+            while not self.closed:
+                frame = await q.get()
+                if frame is None:
+                    break
+                writer.write(frame.delta if frame.delta and frame.prev == last else frame.full)
+                await writer.drain()
+                last = frame.idx
+        except ConnectionError:
+            ...
+        finally:
+            self.clients.discard(q)
+            writer.close()
+
+    async def broadcast(self) -> None:
+        """
+        Render the current frame of the engine once per change and offer it to every client
+        """
+        loop = asyncio.get_running_loop()
+        n = len(self.engine.converter.imgBook) - 1
+        prev, prevRows = -1, None
+        while self.engine.state != "destroyed":
+            if (now := int(self.engine.getPerc() * n)) != prev:
+                img, lrc = await loop.run_in_executor(None, self.engine.getCurInfo)
+                rows = img.split("\n")
+                frame = BroadcastFrame(now, prev, rows, prevRows, lrc)
+                for q in self.clients:
+                    if q.full():  # drop the oldest frame of a slow client
+                        q.get_nowait()
+                    q.put_nowait(frame)
+                prev, prevRows = now, rows
+            await asyncio.sleep(1 / self.engine.converter.fps)
+
+
+async def runClient(host: str = "127.0.0.1", port: int = 8765, sink: Callable[[str, str], None] | None = None) -> None:
+    """
+    Reference client: receive the broadcast frames and pass them to `sink` until the server closes
+
+    Params
+    ------
+        - `host`: host of the server
+        - `port`: port of the server
+        - `sink`: callable taking the frame & the lyrics, writes to the terminal by default
+    """
+    if sink is None:
+        def sink(frame: str, lrc: str) -> None:
+            sys.stdout.write("\x1b[H" + frame + "\n" + lrc.replace("\n", "") + "\x1b[K")
+            sys.stdout.flush()
+
+    reader, writer = await asyncio.open_connection(host, port)
+    rows = []
+    try:
+        while 1:
+            size, = HEADER.unpack(await reader.readexactly(HEADER.size))
+            msg = json.loads(await reader.readexactly(size))
+            if "full" in msg:
+                rows = msg["full"].split("\n")
+            else:
+                for r, row in msg["rows"]:
+                    rows[r] = row
+            sink("\n".join(rows), msg["lrc"])
+    except asyncio.IncompleteReadError:
+        ...
+    finally:
+        writer.close()
+
+
+async def loadTest(host: str = "127.0.0.1", port: int = 8765, n: int = 300, seconds: float = 10) -> None:
+    """
+    Connect `n` clients to a running server and report the frames each of them received
+
+    Params
+    ------
+        - `host`: host of the server
+        - `port`: port of the server
+        - `n`: number of clients
+        - `seconds`: duration of the test
+    """
+    counts = [0] * n
+
+    def counter(i: int) -> Callable[[str, str], None]:
+        def sink(frame: str, lrc: str) -> None:
+            counts[i] += 1
+        return sink
+
+    start = perf_counter()
+    tasks = [asyncio.create_task(runClient(host, port, counter(i))) for i in range(n)]
+    await asyncio.sleep(seconds)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = perf_counter() - start
+    print(f"{n} clients, {elapsed:.1f}s: "
+          f"min {min(counts) / elapsed:.1f} fps, avg {sum(counts) / n / elapsed:.1f} fps, max {max(counts) / elapsed:.1f} fps")
+
+
+if __name__ == "__main__":
+    """
+    python V2SServer.py serve buffer         (a processed video)
+    python V2SServer.py client
+    python V2SServer.py loadtest 300
+    """
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Broadcast a converted video to TCP clients")
+    parser.add_argument("mode", choices=["serve", "client", "loadtest"])
+    parser.add_argument("arg", nargs="?", help="processed video (serve) / number of clients (loadtest)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--strategy", type=int, default=1)
+    args = parser.parse_args()
+
+    match args.mode:
+        case "serve":
+            from threading import Thread
+            from V2SConverter import V2SConverter
+            converter = V2SConverter((200, 80), args.strategy)
+            converter.loadProcessed(args.arg)
+            engine = V2SEngine(converter, args.strategy)
+            Thread(target=engine.loop, daemon=True).start()
+            engine.switch(None)
+            asyncio.run(V2SBroadcastServer(engine, args.host, args.port).serve())
+        case "client":
+            sys.stdout.write("\x1b[2J")
+            asyncio.run(runClient(args.host, args.port))
+        case "loadtest":
+            asyncio.run(loadTest(args.host, args.port, int(args.arg or 300)))
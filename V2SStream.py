@@ -0,0 +1,111 @@
+import sys
+import queue
+import numpy as np
+from threading import Thread
+from typing import Callable, Iterator, Tuple
+from V2SConverter import V2SConverter
+
+
+class V2SRawStream:
+    """
+    Live input of fixed-size raw grey frames (e.g. `ffmpeg -f rawvideo -pix_fmt gray` output),
+    read from stdin or a named pipe.
+
+    Frames go through a bounded queue; when the consumer falls behind, the oldest frames are
+    dropped so the latency stays within a frame or two.
+
+    Params
+    ------
+    - `converter`: Initialized V2SConverter (reso & pixel set)
+    - `size`: size of the raw frames, as `(w, h)` (tuple)
+    - `source`: path of the pipe, or `-` for stdin (str)
+    - `queueSize`: max number of frames waiting to be rendered (int)
+    """
+    def __init__(self, converter: V2SConverter, size: Tuple[int, int], source: str = "-", queueSize: int = 2) -> None:
+        self.converter = converter
+        self.size = size
+        self.source = source
+        self.frames = queue.Queue(queueSize)
+        self.received = self.dropped = 0
+
+    def start(self) -> None:
+        """
+        Start reading frames in the background
+        """
+        Thread(target=self.read, daemon=True).start()
+
+    def read(self) -> None:  # should NOT be called by the main thread
+        """
+        Read frames from the source until it is closed
+        """
+        w, h = self.size
+        with (open(sys.stdin.fileno(), "rb", closefd=False) if self.source == "-" else open(self.source, "rb")) as f:
+            while len(buf := f.read(w * h)) == w * h:
+                self.received += 1
+                self.push(np.frombuffer(buf, dtype=np.uint8).reshape(h, w))
+        self.push(None)  # end of stream
+
+    def push(self, frame: np.ndarray | None) -> None:
+        """
+        Put a frame into the queue, dropping the oldest one if it is full
+
+        Param
+        -----
+            - `frame`: raw grey frame (`None` for the end of the stream)
+        """
+        while 1:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    ...
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Yield the rendered frames as soon as they arrive
+        """
+        while (frame := self.frames.get()) is not None:
+            yield self.converter.render(frame / 255, self.converter.pixelSet)
+
+    def play(self, sink: Callable[[str], None] | None = None) -> None:
+        """
+        Render the stream to the output backend until the source is closed
+
+        Param
+        -----
+            - `sink`: callable taking a rendered frame, writes to the terminal by default
+        """
+        if sink is None:
+            def sink(frame: str) -> None:
+                sys.stdout.write("\x1b[H" + frame)
+                sys.stdout.flush()
+        self.start()
+        for frame in self:
+            sink(frame)
+
+
+if __name__ == "__main__":
+    """
+    ffmpeg -i bad_apple.mp4 -f rawvideo -pix_fmt gray -s 480x360 - | python V2SStream.py 480 360
+    """
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Play raw grey frames from stdin or a named pipe as chrs")
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int)
+    parser.add_argument("source", nargs="?", default="-")
+    parser.add_argument("--reso", default="120x48", help="chrs per row & rows, as WxH")
+    parser.add_argument("--pixel", type=int, default=2, help="pixel mode of the converter")
+    args = parser.parse_args()
+
+    stream = V2SRawStream(
+        V2SConverter(tuple(map(int, args.reso.split("x"))), 1, args.pixel),
+        (args.width, args.height),
+        args.source,
+    )
+    sys.stdout.write("\x1b[2J")
+    stream.play()
+    print(f"\n{stream.received} frames received, {stream.dropped} dropped", file=sys.stderr)
@@ -19,9 +19,14 @@ class V2SUI:
         self.monitorSize = [200, 80]
         self.allowBuffer = IntVar(value=0)
         self.dynamicReso = IntVar(value=1)
+        self.adaptiveReso = IntVar(value=0)
+        self.rasterDisplay = IntVar(value=0)
+        self.dither = IntVar(value=0)
         self.pixelSet = IntVar(value=2)
         self.fontScale = DoubleVar(value=1.0)
         self.resolution = DoubleVar(value=1.0)
+        self.memBudget = IntVar(value=0)  # MB, 0 for unlimited
+        self.cacheQuota = IntVar(value=2048)  # MB
         self.process = DoubleVar(value=0.0)
         self.videoName = StringVar(value="")
         self.lrcName = StringVar(value="")
@@ -61,8 +66,10 @@ class V2SUI:
         self.videoLb.pack(expand=1, fill="both")
         rightInfo = Frame(infoDiv)
         rightInfo.pack(side="right", expand=1, fill="both", ipadx="30")
-        self.ProcessLb = Label(rightInfo, text="Good to go")
+        self.ProcessLb = Label(rightInfo, text="Good to go", wraplength=240)  # long messages wrap
         self.ProcessLb.pack(expand=1, fill="both")
+        self.cancelBt = Button(rightInfo, text="Cancel")
+        self.cancelBt.pack(expand=1, fill="both")
 
     def showConfig(self) -> None:
         """
@@ -91,17 +98,61 @@ class V2SUI:
             variable=self.pixelSet,
             value=2,
         ).pack()
+        Radiobutton(
+            div,
+            text="Pixel Set 4 (Shape)",
+            variable=self.pixelSet,
+            value=3,
+        ).pack()
+        Radiobutton(
+            div,
+            text="Pixel Set 5 (Braille)",
+            variable=self.pixelSet,
+            value=4,
+        ).pack()
+        Radiobutton(
+            div,
+            text="Pixel Set 6 (Quadrant)",
+            variable=self.pixelSet,
+            value=5,
+        ).pack()
+        Checkbutton(
+            div,
+            text="Dither (Braille & Quadrant)",
+            variable=self.dither,
+        ).pack()
         Checkbutton(
             div,
             text="Allow Buffer",
             variable=self.allowBuffer,
         ).pack()
+        Scale(
+            div,
+            label="Buffer Quota (MB)",
+            from_=256,
+            to=16384,
+            resolution=256,
+            showvalue=1,
+            length=150,
+            orient="horizontal",
+            variable=self.cacheQuota,
+        ).pack()
+        Checkbutton(
+            div,
+            text="Raster display",
+            variable=self.rasterDisplay,
+        ).pack()
         self.strategyCheck = Checkbutton(
             div,
             text="Allow dynamic reso change\n(May reduce fps)",
             variable=self.dynamicReso,
             state="disabled" if self.monitorWin else "normal")
         self.strategyCheck.pack()
+        Checkbutton(
+            div,
+            text="Adaptive resolution\n(Lower reso under load)",
+            variable=self.adaptiveReso,
+        ).pack()
         Scale(
             div,
             label="Resolution",
@@ -124,6 +175,17 @@ class V2SUI:
             orient="horizontal",
             variable=self.fontScale,
         ).pack()
+        Scale(
+            div,
+            label="Memory Budget (MB)",
+            from_=0,
+            to=8192,
+            resolution=256,
+            showvalue=1,
+            length=150,
+            orient="horizontal",
+            variable=self.memBudget,
+        ).pack()
 
     def showMonitor(self, processReso: float = 1e-6) -> None:
         """
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+import pytest
+from V2SBench import DEFAULT_SCRIPT, budgetCheck, report, runSession, syntheticConverter
+from V2SEngine import V2SEngine, VirtualClock
+
+MB = 2**20
+
+
+def writeClip(filePath: str, grey: bool, frames: int = 120, size: tuple = (320, 240)) -> str:
+    """
+    Write a clip of a scrolling gradient (`grey`) or of a white disc growing after a black intro
+    """
+    writer = cv2.VideoWriter(filePath, cv2.VideoWriter_fourcc(*"MJPG"), 30, size)
+    x = np.linspace(0, 255, size[0])[None, :, None].repeat(size[1], axis=0).repeat(3, axis=2)
+    for i in range(frames):
+        if grey:
+            frame = ((x + 2 * i) % 256).astype(np.uint8)
+        else:
+            frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+            if i >= 30:
+                cv2.circle(frame, (size[0] // 2, size[1] // 2), 10 + i % 80, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return filePath
+
+
+@pytest.fixture(scope="module")
+def clips(tmp_path_factory) -> dict:
+    root = tmp_path_factory.mktemp("clips")
+    return {
+        "bw": writeClip(str(root / "bw.avi"), False),
+        "grey": writeClip(str(root / "grey.avi"), True),
+    }
+
+
+@pytest.mark.parametrize("clip, budget, prerendered", [
+    ("bw", 3 * MB, True),  # packed to 1 bit per pixel
+    ("grey", 12 * MB, True),  # uint8
+    ("grey", 9.85 * MB, False),  # only the frames fit, rendered when played
+])
+def testBudget(clips: dict, clip: str, budget: float, prerendered: bool) -> None:
+    result = budgetCheck(clips[clip], int(budget), reso=(80, 32))
+    assert result["prerendered"] == prerendered
+    assert result["reportedMB"] * MB <= budget
+
+
+def testOverBudget(clips: dict) -> None:
+    with pytest.raises(MemoryError):
+        budgetCheck(clips["grey"], 8 * MB, reso=(80, 32))
+
+
+def testSession() -> None:
+    # 12 virtual seconds of 30 fps: paused from 5.0 to 6.0 s, at the end of the video from 11.0 s
+    result = report(runSession(V2SEngine(syntheticConverter(), 1, clock=VirtualClock()), DEFAULT_SCRIPT, 12.0))
+    assert result["ticks"] == 361
+    assert result["skipped"] == 0
+    assert result["repeated"] == 60
+    assert result["advanced"] == 296
+    assert result["lrcSwitches"] == 10
+    assert len(result["seekRenderMs"]) == 3